@@ -0,0 +1,71 @@
+import pandas as pd
+import numpy as np
+import os
+from contextlib import contextmanager
+from typing import Iterator
+
+OUTPUT_FORMATS = ('csv', 'parquet', 'feather', 'npz')
+
+@contextmanager
+def atomic_output(path: str) -> Iterator[str]:
+    """Yields a temp path next to `path` (same extension) and renames it into place on success."""
+    root, ext = os.path.splitext(path)
+    tmp_path = f"{root}.tmp-{os.getpid()}{ext}"
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def _column_array(column: pd.Series) -> np.ndarray:
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        column = column.astype(column.cat.categories.dtype)
+    if pd.api.types.is_object_dtype(column) or pd.api.types.is_string_dtype(column):
+        return column.fillna('').astype(str).to_numpy(dtype=str)
+    if isinstance(column.dtype, pd.api.extensions.ExtensionDtype) and pd.api.types.is_numeric_dtype(column):
+        return column.to_numpy(dtype=np.float64, na_value=np.nan)
+    return column.to_numpy()
+
+def write_table(df: pd.DataFrame, stem: str, fmt: str = 'parquet', index: bool = False) -> str:
+    """Writes `df` to `stem.<fmt>` atomically and returns the path.
+
+    Parquet and Feather are typed and zstd-compressed; npz stores one compressed array per
+    column (strings as fixed-width unicode, nullable numbers as float); csv is kept for opt-in text output.
+    Use `index=True` for labelled matrices such as the similarity tables.
+    """
+    if fmt not in OUTPUT_FORMATS:
+        raise ValueError(f"output format must be one of {OUTPUT_FORMATS}, got {fmt!r}")
+    path = f"{stem}.{fmt}"
+    with atomic_output(path) as tmp_path:
+        if fmt == 'csv':
+            df.to_csv(tmp_path, index=index)
+        elif fmt == 'parquet':
+            df.to_parquet(tmp_path, index=index, compression='zstd')
+        elif fmt == 'feather':
+            (df.reset_index() if index else df.reset_index(drop=True)).to_feather(tmp_path, compression='zstd')
+        else:
+            table = df.reset_index() if index else df
+            arrays = {str(col): _column_array(table[col]) for col in table.columns}
+            np.savez_compressed(tmp_path, **arrays)
+    return path
+
+def read_table(path: str, index_col: str | None = None) -> pd.DataFrame:
+    """Reads a table written by write_table, restoring `index_col` as the index when given."""
+    fmt = os.path.splitext(path)[1].lstrip('.')
+    if fmt == 'csv':
+        df = pd.read_csv(path)
+    elif fmt == 'parquet':
+        df = pd.read_parquet(path)
+        # A written index comes back as a column, as in the other formats
+        if not isinstance(df.index, pd.RangeIndex):
+            df = df.reset_index()
+    elif fmt == 'feather':
+        df = pd.read_feather(path)
+    elif fmt == 'npz':
+        with np.load(path) as data:
+            df = pd.DataFrame({name: data[name] for name in data.files})
+    else:
+        raise ValueError(f"Unknown output format for {path}")
+    return df.set_index(index_col) if index_col else df
@@ -0,0 +1,357 @@
+import os
+import sys
+import json
+import logging
+import argparse
+import platform
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from contextlib import contextmanager
+from typing import Callable
+
+from io_load import normalize_hs92_code, _read_csv
+from synthetic import SCALES, generate_scale
+
+# Committed baselines, one per scale; compared against by default on a matching host
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'bench')
+HOST_KEYS = ('platform', 'machine', 'cpu_count')
+
+def _legacy_normalize_hs92_code(codes: pd.Series) -> pd.Series:
+    codes = codes.apply(lambda x:x if x.isdigit() else np.nan)
+    return codes.astype('Int32')
+
+def _best_of(fn, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def bench_code_normalization(n_rows: int = 2_000_000, error_share: float = 0.01, repeat: int = 3, seed: int = 42) -> pd.DataFrame:
+    """Times the legacy per-row code lambda against the vectorized and parse-time Arrow paths."""
+    rng = np.random.default_rng(seed)
+    codes = pd.Series(rng.integers(101, 9999, n_rows)).map('{:04d}'.format)
+    codes[rng.random(n_rows) < error_share] = 'XXXX'
+    expected = _legacy_normalize_hs92_code(codes)
+    assert normalize_hs92_code(codes).equals(expected), "Vectorized codes differ from the legacy path"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, 'codes.csv')
+        codes.rename('product_hs92_code').to_frame().to_csv(csv_path, index=False)
+        dtype_spec = {'product_hs92_code': 'str'}
+        results = {
+            'legacy_apply': _best_of(lambda: _legacy_normalize_hs92_code(codes), repeat),
+            'vectorized': _best_of(lambda: normalize_hs92_code(codes), repeat),
+            'legacy_parse_and_apply': _best_of(lambda: _legacy_normalize_hs92_code(_read_csv(csv_path, dtype_spec)['product_hs92_code']), repeat),
+            'arrow_parse_and_vectorized': _best_of(lambda: normalize_hs92_code(_read_csv(csv_path, dtype_spec, engine='pyarrow')['product_hs92_code']), repeat),
+        }
+
+    timings = pd.Series(results, name='seconds').to_frame()
+    timings['speedup_vs_legacy'] = timings.loc['legacy_apply', 'seconds'] / timings['seconds']
+    timings.loc[['legacy_parse_and_apply', 'arrow_parse_and_vectorized'], 'speedup_vs_legacy'] = (
+        timings.loc['legacy_parse_and_apply', 'seconds'] / timings.loc[['legacy_parse_and_apply', 'arrow_parse_and_vectorized'], 'seconds']
+    )
+    return timings
+
+# name -> (setup(ctx) -> args, fn(*args)); setup runs untimed before every repeat
+BENCHMARKS: dict[str, tuple[Callable, Callable]] = {}
+
+def benchmark(name: str, setup: Callable | None = None):
+    """Registers `fn` under `name`; `setup(ctx)` returns fresh args per repeat so in-place functions time the same work."""
+    def register(fn: Callable) -> Callable:
+        BENCHMARKS[name] = (setup or (lambda ctx: ()), fn)
+        return fn
+    return register
+
+class BenchContext:
+    """Synthetic data paths plus lazily built, shared inputs (frames, panel, phi) for the benchmarks.
+
+    Benchmarks that write files get fresh directories from `scratch()`, all under `scratch_dir`.
+    """
+
+    def __init__(self, data_dir: str, year: int, scratch_dir: str):
+        self.data_dir = data_dir
+        self.year = year
+        self.scratch_dir = scratch_dir
+        self._cache = {}
+
+    def path(self, stem: str) -> str:
+        return os.path.join(self.data_dir, f'{stem}.csv')
+
+    def scratch(self) -> str:
+        return tempfile.mkdtemp(dir=self.scratch_dir)
+
+    def _get(self, key: str, build: Callable):
+        if key not in self._cache:
+            self._cache[key] = build()
+        return self._cache[key]
+
+    @property
+    def df(self) -> pd.DataFrame:
+        """The Step 1 frame: country-product rows joined to product meta and layout."""
+        from io_load import load_country_product, load_product_meta, load_product_space_vectors
+
+        def build():
+            df = load_country_product(self.year, self.path('hs92_country_product_year_4'), cache_dir=os.path.join(self.data_dir, 'cache'))
+            df = df.merge(load_product_meta(self.path('product_hs92')), on='product_hs92_code', how='left')
+            df = df.merge(self.vectors, on='product_hs92_code', how='left')
+            return df.dropna(subset=['product_hs92_code']).reset_index(drop=True)
+        return self._get('df', build)
+
+    @property
+    def vectors(self) -> pd.DataFrame:
+        from io_load import load_product_space_vectors
+        return self._get('vectors', lambda: load_product_space_vectors(self.path('umap_layout_hs92')))
+
+    @property
+    def edges(self) -> pd.DataFrame:
+        from io_load import load_product_space_edges
+        return self._get('edges', lambda: load_product_space_edges(self.path('top_edges_hs92')))
+
+    @property
+    def product_meta(self) -> pd.DataFrame:
+        from io_load import load_product_meta
+        return self._get('product_meta', lambda: load_product_meta(self.path('product_hs92')))
+
+    @property
+    def frame(self) -> pd.DataFrame:
+        """The Step 3 frame: presence, density and x_binary columns added."""
+        from presence import add_rca_binary, add_peer_relative_presence
+
+        def build():
+            df = add_peer_relative_presence(add_rca_binary(self.df.copy()))
+            df['density'] = (1 - df['distance']).clip(0, 1)
+            df['x_binary'] = df['binary_specialization']
+            return df
+        return self._get('frame', build)
+
+    @property
+    def panel(self):
+        from panel import build_panel
+        from presence import add_rca_binary, add_peer_relative_presence
+        return self._get('panel', lambda: add_peer_relative_presence(add_rca_binary(build_panel(self.df))))
+
+    @property
+    def phi(self) -> np.ndarray:
+        from fit import proximity_matrix
+        return self._get('phi', lambda: proximity_matrix(self.panel.binary))
+
+@contextmanager
+def _working_dir(path: str):
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+def _register_suite() -> None:
+    import io_load, presence, fit, similarity, viz
+    from panel import build_panel
+
+    # io_load
+    benchmark('io_load.normalize_hs92_code', lambda ctx: (pd.read_csv(ctx.path('hs92_country_product_year_4'), usecols=['product_hs92_code'], dtype=str)['product_hs92_code'],))(io_load.normalize_hs92_code)
+    benchmark('io_load.build_country_product_cache', lambda ctx: (ctx.path('hs92_country_product_year_4'), ctx.scratch()))(
+        lambda path, cache_dir: io_load.build_country_product_cache(path, cache_dir))
+    benchmark('io_load.load_country_product[csv]', lambda ctx: (ctx.year, ctx.path('hs92_country_product_year_4')))(
+        lambda year, path: io_load.load_country_product(year, path, use_cache=False))
+    benchmark('io_load.load_country_product[cache]', lambda ctx: (ctx.year, ctx.path('hs92_country_product_year_4'), os.path.join(ctx.data_dir, 'cache')))(
+        lambda year, path, cache_dir: io_load.load_country_product(year, path, cache_dir=cache_dir))
+    benchmark('io_load.load_country_product_years[cache]', lambda ctx: (ctx.year, ctx.path('hs92_country_product_year_4'), os.path.join(ctx.data_dir, 'cache')))(
+        lambda year, path, cache_dir: io_load.load_country_product_years(range(year - 2, year + 1), path, cache_dir=cache_dir))
+    benchmark('io_load.load_product_meta', lambda ctx: (ctx.path('product_hs92'),))(io_load.load_product_meta)
+    benchmark('io_load.load_product_space_vectors', lambda ctx: (ctx.path('umap_layout_hs92'),))(io_load.load_product_space_vectors)
+    benchmark('io_load.load_product_space_edges', lambda ctx: (ctx.path('top_edges_hs92'),))(io_load.load_product_space_edges)
+    benchmark('io_load.load_country_year', lambda ctx: (ctx.path('hs92_country_year'),))(io_load.load_country_year)
+
+    # presence
+    benchmark('panel.build_panel', lambda ctx: (ctx.df,))(build_panel)
+    benchmark('presence.add_rca_binary[frame]', lambda ctx: (ctx.df,))(lambda df: presence.add_rca_binary(df, mode='arrays'))
+    benchmark('presence.add_rca_binary[panel]', lambda ctx: (ctx.panel,))(presence.add_rca_binary)
+    benchmark('presence.add_peer_relative_presence[frame]', lambda ctx: (ctx.df,))(lambda df: presence.add_peer_relative_presence(df, mode='arrays'))
+    benchmark('presence.add_peer_relative_presence[panel]', lambda ctx: (ctx.panel,))(presence.add_peer_relative_presence)
+    benchmark('presence.nearest_peer_groups', lambda ctx: (similarity.country_similarity_cosine(ctx.panel), ctx.panel.countries))(presence.nearest_peer_groups)
+
+    # fit
+    benchmark('fit.add_density_from_distance', lambda ctx: (ctx.df.copy(),))(fit.add_density_from_distance)
+    benchmark('fit.proximity_matrix', lambda ctx: (ctx.panel.binary,))(fit.proximity_matrix)
+    benchmark('fit.density_from_proximity', lambda ctx: (ctx.panel.binary, ctx.phi))(fit.density_from_proximity)
+    benchmark('fit.presence_fingerprint', lambda ctx: (ctx.panel.binary, ctx.panel.products))(fit.presence_fingerprint)
+    benchmark('fit.cached_proximity_matrix[miss]', lambda ctx: (ctx.panel.binary, ctx.year, ctx.scratch()))(
+        lambda binary, year, cache_dir: fit.cached_proximity_matrix(binary, year, 1.0, cache_dir=cache_dir))
+    benchmark('fit.recompute_density_from_proximity[frame]', lambda ctx: (ctx.frame.copy(),))(fit.recompute_density_from_proximity)
+    benchmark('fit.recompute_density_from_proximity[panel]', lambda ctx: (ctx.panel,))(fit.recompute_density_from_proximity)
+
+    # similarity
+    benchmark('similarity.country_similarity_cosine[frame]', lambda ctx: (ctx.frame,))(similarity.country_similarity_cosine)
+    benchmark('similarity.country_similarity_cosine[panel]', lambda ctx: (ctx.panel,))(similarity.country_similarity_cosine)
+    benchmark('similarity.country_similarity_jaccard[panel]', lambda ctx: (ctx.panel,))(similarity.country_similarity_jaccard)
+    benchmark('similarity.country_similarity_jaccard[packed]', lambda ctx: (ctx.panel,))(lambda panel: similarity.country_similarity_jaccard(panel, packed=True))
+    benchmark('similarity.build_similarity_index', lambda ctx: (ctx.panel,))(similarity.build_similarity_index)
+
+    # viz
+    first_country = lambda ctx: ctx.frame[ctx.frame['country_iso3_code'] == ctx.frame['country_iso3_code'].iloc[0]]
+    benchmark('viz.build_edge_trace', lambda ctx: (ctx.vectors, ctx.edges))(viz.build_edge_trace)
+    benchmark('viz.plot_product_space', lambda ctx: (first_country(ctx), ctx.vectors, ctx.edges, ctx.product_meta))(viz.plot_product_space)
+    benchmark('viz.plot_opportunities_scatter', lambda ctx: (first_country(ctx),))(viz.plot_opportunities_scatter)
+    benchmark('viz.render_country_figures', lambda ctx: (ctx.frame, ctx.vectors, ctx.edges, ctx.product_meta, ctx.scratch()))(
+        lambda df, nodes, edges, meta, root: viz.render_country_figures(df, nodes, edges, meta, output_root=root, incremental=False))
+
+    # Full pipeline in a fresh working directory whose ../data points at the synthetic data
+    def pipeline_setup(ctx):
+        import yaml
+        run_dir = ctx.scratch()
+        os.symlink(ctx.data_dir, os.path.join(run_dir, 'data'))
+        work_dir = os.path.join(run_dir, 'work')
+        os.makedirs(work_dir)
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'config.yaml')) as f:
+            config = yaml.safe_load(f)
+        # Fixed worker counts keep the timing independent of the machine's core count
+        config.update(year=ctx.year, stage_cache=False, proximity_cache=False, render_workers=1, year_workers=1, years=None)
+        with open(os.path.join(work_dir, 'config.yaml'), 'w') as f:
+            yaml.dump(config, f)
+        return (work_dir,)
+
+    def pipeline_main(work_dir):
+        import pipeline
+        with _working_dir(work_dir):
+            pipeline.main()
+    benchmark('pipeline.main', pipeline_setup)(pipeline_main)
+
+def run_benchmarks(data_dir: str, year: int, repeat: int = 3, names: list[str] | None = None) -> dict:
+    """Times the registered benchmarks (best of `repeat`, setup untimed) on the synthetic data in `data_dir`.
+
+    Files the benchmarks write go to a temporary directory removed at the end.
+    """
+    if not BENCHMARKS:
+        _register_suite()
+    unknown = set(names or ()) - set(BENCHMARKS)
+    if unknown:
+        raise ValueError(f"Unknown benchmarks: {sorted(unknown)}")
+    results = {}
+    with tempfile.TemporaryDirectory() as scratch_dir:
+        ctx = BenchContext(data_dir, year, scratch_dir)
+        for name, (setup, fn) in BENCHMARKS.items():
+            if names and name not in names:
+                continue
+            timings = []
+            for _ in range(repeat):
+                args = setup(ctx)
+                start = time.perf_counter()
+                fn(*args)
+                timings.append(time.perf_counter() - start)
+            results[name] = round(min(timings), 6)
+            logging.info(f"{name}: {results[name]:.4f}s")
+    return results
+
+def default_baseline_path(scale: str) -> str:
+    return os.path.join(BASELINE_DIR, f'baseline_{scale}.json')
+
+def compare_to_baseline(results: dict, baseline: dict, tolerance: float = 0.25, min_seconds: float = 0.005) -> pd.DataFrame:
+    """Ratio of each timing to the baseline; a regression is slower by more than `tolerance` and by at least `min_seconds`.
+
+    Benchmarks found on one side only are kept, with `status` 'new' (no baseline timing) or
+    'missing' (not in the current results); the others are 'ok' or 'regression'.
+    """
+    names = list(results) + [name for name in baseline['results'] if name not in results]
+    comparison = pd.DataFrame({
+        'baseline_s': [baseline['results'].get(name, np.nan) for name in names],
+        'current_s': [results.get(name, np.nan) for name in names],
+    }, index=pd.Index(names, name='benchmark'))
+    comparison['ratio'] = comparison['current_s'] / comparison['baseline_s']
+    comparison['regression'] = (comparison['ratio'] > 1 + tolerance) & (comparison['current_s'] - comparison['baseline_s'] >= min_seconds)
+    comparison['status'] = np.select(
+        [comparison['baseline_s'].isna(), comparison['current_s'].isna(), comparison['regression']],
+        ['new', 'missing', 'regression'], default='ok')
+    return comparison
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark io_load, presence, fit, similarity, viz and pipeline.main on synthetic Atlas data.")
+    parser.add_argument('--scale', choices=SCALES, default='small')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--only', action='append', metavar='NAME', help="Run only this benchmark (repeatable).")
+    parser.add_argument('--data-dir', help="Reuse synthetic data here instead of generating it in a temp directory.")
+    parser.add_argument('--output', default='bench_results.json', help="Where to write the results JSON.")
+    parser.add_argument('--baseline', help="Baseline JSON to compare against (default: bench/baseline_<scale>.json); exits non-zero on regressions.")
+    parser.add_argument('--no-baseline', action='store_true', help="Skip the baseline comparison.")
+    parser.add_argument('--save-baseline', action='store_true', help="Write the results to the baseline instead of comparing.")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed slowdown vs the baseline (0.25 = 25%%).")
+    parser.add_argument('--code-normalization', action='store_true', help="Print the legacy vs vectorized code normalization table and exit.")
+    args = parser.parse_args(argv)
+
+    if args.code_normalization:
+        print(bench_code_normalization())
+        return 0
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    n_countries, n_products, n_years = SCALES[args.scale]
+    year = 2023
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = args.data_dir or os.path.join(tmp, 'data')
+        if not os.path.exists(os.path.join(data_dir, 'hs92_country_product_year_4.csv')):
+            generate_scale(data_dir, args.scale, args.seed, last_year=year)
+        # Stage logs would drown the benchmark lines
+        logging.getLogger().setLevel(logging.WARNING)
+        results = run_benchmarks(os.path.abspath(data_dir), year, args.repeat, args.only)
+
+    report = {
+        'scale': args.scale,
+        'shape': {'countries': n_countries, 'products': n_products, 'years': n_years},
+        'seed': args.seed,
+        'repeat': args.repeat,
+        'python': platform.python_version(),
+        'platform': sys.platform,
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'machine': platform.machine(),
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(pd.Series(results, name='seconds').to_string())
+
+    if args.no_baseline:
+        return 0
+    baseline_path = args.baseline or default_baseline_path(args.scale)
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(baseline_path)), exist_ok=True)
+        with open(baseline_path, 'w') as f:
+            json.dump(report, f, indent=2)
+            f.write('\n')
+        print(f"Baseline saved to {baseline_path}")
+        return 0
+    if not os.path.exists(baseline_path):
+        print(f"No baseline at {baseline_path}; record one with --save-baseline (or pass --no-baseline).", file=sys.stderr)
+        return 1
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    if (baseline['scale'], baseline['seed']) != (args.scale, args.seed):
+        raise ValueError(f"Baseline was recorded at scale={baseline['scale']!r}, seed={baseline['seed']}; rerun with the same settings")
+    # Absolute timings only compare on the same kind of machine
+    host = {key: report[key] for key in HOST_KEYS}
+    recorded = {key: baseline.get(key) for key in HOST_KEYS}
+    if host != recorded:
+        print(f"Baseline {baseline_path} was recorded on {recorded}, this machine is {host}; skipping the comparison "
+              f"(record a local baseline with --save-baseline --baseline PATH).", file=sys.stderr)
+        return 0
+    if args.only:
+        baseline = {**baseline, 'results': {name: value for name, value in baseline['results'].items() if name in args.only}}
+    comparison = compare_to_baseline(results, baseline, args.tolerance)
+    print(comparison.round(4).to_string())
+    for status, note in (('new', "not in the baseline; rerun with --save-baseline to record"), ('missing', "in the baseline but not run")):
+        names = comparison.index[comparison['status'] == status].tolist()
+        if names:
+            print(f"{status.upper()}: {len(names)} benchmark(s) {note}: {', '.join(names)}", file=sys.stderr)
+    regressions = comparison.index[comparison['regression']].tolist()
+    if regressions:
+        print(f"REGRESSION: {len(regressions)} benchmark(s) slower than baseline by more than {args.tolerance:.0%}: {', '.join(regressions)}", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,76 @@
+import pandas as pd
+import numpy as np
+from scipy import sparse
+from scipy.sparse.linalg import LinearOperator, eigsh
+
+from fit import density_from_proximity
+
+def _standardize(values: np.ndarray) -> np.ndarray:
+    return (values - values.mean()) / values.std()
+
+def _second_eigenvector(a: sparse.csr_matrix, u_inv: np.ndarray) -> np.ndarray:
+    # Second eigenvector of the symmetric S = A U^-1 A^T, applied matrix-free with sparse products
+    n = a.shape[0]
+    if n < 3:
+        dense = (a @ sparse.diags(u_inv) @ a.T).toarray()
+        return np.linalg.eigh(dense)[1][:, -2]
+    operator = LinearOperator((n, n), matvec=lambda v: a @ (u_inv * (a.T @ v)), dtype=np.float64)
+    values, vectors = eigsh(operator, k=2, which='LA', v0=np.ones(n), tol=1e-10)
+    return vectors[:, np.argsort(values)[0]]
+
+def complexity_indices(binary) -> tuple[np.ndarray, np.ndarray]:
+    """ECI per country and PCI per product from a binary country × product matrix.
+
+    ECI is the eigenvector of M~C = D^-1 M U^-1 M^T for the second largest eigenvalue, found with
+    a sparse symmetric eigensolver on D^-1/2 M U^-1 M^T D^-1/2 (same spectrum). PCI follows from
+    the same eigenvector as U^-1 M^T ECI. Both are standardized; ECI is signed to correlate
+    positively with diversity. Countries and products without any presence get NaN.
+    """
+    m = sparse.csr_matrix(binary, dtype=np.float64)
+    m.eliminate_zeros()
+    m.data[:] = 1
+    diversity = np.asarray(m.sum(axis=1)).ravel()
+    ubiquity = np.asarray(m.sum(axis=0)).ravel()
+    rows, cols = np.flatnonzero(diversity > 0), np.flatnonzero(ubiquity > 0)
+
+    eci = np.full(m.shape[0], np.nan)
+    pci = np.full(m.shape[1], np.nan)
+    if len(rows) < 2:
+        return eci, pci
+    m = m[rows][:, cols]
+    d_inv_sqrt = 1 / np.sqrt(diversity[rows])
+    u_inv = 1 / ubiquity[cols]
+
+    vector = d_inv_sqrt * _second_eigenvector(sparse.diags(d_inv_sqrt) @ m, u_inv)
+    if np.corrcoef(vector, diversity[rows])[0, 1] < 0:
+        vector = -vector
+    eci[rows] = _standardize(vector)
+    pci[cols] = _standardize(u_inv * (m.T @ vector))
+    return eci, pci
+
+def complexity_outlook(binary, pci: np.ndarray, phi: np.ndarray, out: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:
+    """Complexity outlook gain (country × product) and complexity outlook index (per country).
+
+    cog_{c,p} = sum_q phi_{p,q} / (sum_r phi_{r,q}) (1 - M_{c,q}) PCI_q and
+    coi_c = sum_p density_{c,p} (1 - M_{c,p}) PCI_p, with density = 1 - distance from
+    density_from_proximity. Products without a PCI contribute nothing. The cog matrix is
+    written into `out` when given (e.g. panel.empty()).
+    """
+    absent = 1 - np.asarray(binary, dtype=np.float32)
+    pci = np.nan_to_num(np.asarray(pci, dtype=np.float32))
+    column_total = phi.sum(axis=0, dtype=np.float32)
+    scaled_pci = np.divide(pci, column_total, out=np.zeros_like(pci), where=column_total > 0)
+
+    cog = np.empty(absent.shape, dtype=np.float32) if out is None else out
+    cog[:] = (absent * scaled_pci) @ np.asarray(phi, dtype=np.float32).T
+    density = np.nan_to_num(density_from_proximity(binary, phi))
+    coi = (density * absent) @ pci
+    return cog, coi.astype(np.float64)
+
+def recompute_complexity(panel, phi: np.ndarray) -> tuple[pd.DataFrame, pd.DataFrame, np.ndarray]:
+    """ECI/COI per country, PCI per product and the cog matrix for a CountryProductPanel with `binary` set."""
+    eci, pci = complexity_indices(panel.binary)
+    cog, coi = complexity_outlook(panel.binary, pci, phi, out=panel.empty())
+    countries = pd.DataFrame({'eci': eci, 'coi': coi, 'diversity': panel.binary.sum(axis=1, dtype=np.int64)}, index=panel.countries)
+    products = pd.DataFrame({'pci': pci, 'ubiquity': panel.binary.sum(axis=0, dtype=np.int64)}, index=panel.products)
+    return countries, products, cog
@@ -0,0 +1,231 @@
+import pandas as pd
+import numpy as np
+import os
+import ast
+import json
+import shutil
+import pickle
+import hashlib
+import inspect
+import logging
+import textwrap
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from typing import Callable
+
+from panel import CountryProductPanel, MATRIX_FIELDS
+from profiling import artifact_shape
+
+@dataclass
+class Stage:
+    """A pipeline step with declared inputs: upstream stages, data files and the config keys it reads.
+
+    `fn(config, **upstream_artifacts)` receives the upstream artifacts named in its signature and
+    returns a dict of named artifacts. `files` are input files whose signatures enter the key and
+    `writes` lists files the stage produces as a side effect, so a cache hit is ignored when one
+    is missing; both are formatted with the config (e.g. '{output_format}') or a function of it.
+    `always_run` stages skip the cache, for outputs too many to list that the stage tracks itself
+    (e.g. the render manifest). Stages must not modify upstream artifacts in place; frames are
+    shallow-copied before new columns are set.
+    """
+    name: str
+    fn: Callable[..., dict]
+    deps: list[str] = field(default_factory=list)
+    files: list[str] | Callable[[dict], list[str]] = field(default_factory=list)
+    config_keys: list[str] = field(default_factory=list)
+    writes: list[str] | Callable[[dict], list[str]] = field(default_factory=list)
+    always_run: bool = False
+
+    def input_files(self, config: dict) -> list[str]:
+        return _resolve_paths(self.files, config)
+
+    def output_files(self, config: dict) -> list[str]:
+        return _resolve_paths(self.writes, config)
+
+def _resolve_paths(paths, config: dict) -> list[str]:
+    paths = paths(config) if callable(paths) else paths
+    return [path.format_map(config) for path in paths]
+
+def _file_signature(path: str) -> list:
+    if not os.path.exists(path):
+        return [path, None]
+    stat = os.stat(path)
+    return [os.path.abspath(path), stat.st_mtime_ns, stat.st_size]
+
+def _imported_modules(tree: ast.AST) -> set[str]:
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names.add(node.module)
+    return names
+
+def _global_names(code) -> set[str]:
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if inspect.iscode(const):
+            names |= _global_names(const)
+    return names
+
+def code_sources(fn: Callable) -> dict[str, str]:
+    """Source of `fn` and of the project code it reaches, keyed by qualified name or module name.
+
+    Project code is the functions defined next to `fn` that it calls, and the modules in the same
+    directory that any of these import or reference, followed transitively through their imports.
+    """
+    root = os.path.dirname(os.path.abspath(inspect.getsourcefile(fn)))
+    sources, modules = {}, set()
+    functions = [fn]
+    while functions:
+        function = functions.pop()
+        if function.__qualname__ in sources:
+            continue
+        sources[function.__qualname__] = inspect.getsource(function)
+        modules |= _imported_modules(ast.parse(textwrap.dedent(sources[function.__qualname__])))
+        for name in _global_names(function.__code__):
+            value = function.__globals__.get(name)
+            if inspect.isfunction(value) and value.__module__ == fn.__module__:
+                functions.append(value)
+            elif inspect.ismodule(value) or inspect.isfunction(value) or inspect.isclass(value):
+                modules.add(value.__name__ if inspect.ismodule(value) else value.__module__)
+
+    pending = list(modules)
+    while pending:
+        name = pending.pop()
+        path = os.path.join(root, *name.split('.')) + '.py'
+        if name in sources or name == fn.__module__ or not os.path.exists(path):
+            continue
+        with open(path) as f:
+            sources[name] = f.read()
+        pending.extend(_imported_modules(ast.parse(sources[name])))
+    return sources
+
+def stage_key(stage: Stage, config: dict, upstream_keys: list[str]) -> str:
+    """Hashes the stage's code (with the project code it calls), data file signatures, config values and upstream keys."""
+    payload = {
+        'name': stage.name,
+        'code': code_sources(stage.fn),
+        'files': [_file_signature(path) for path in stage.input_files(config)],
+        'config': {key: config.get(key) for key in stage.config_keys},
+        'upstream': upstream_keys,
+    }
+    return hashlib.sha1(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+def _save_artifact(path: str, value) -> str:
+    if isinstance(value, pd.DataFrame):
+        value.to_parquet(path + '.parquet')
+        return 'parquet'
+    if isinstance(value, CountryProductPanel):
+        # One .npy per matrix so cache hits can memory-map them; labels may hold Python objects
+        os.makedirs(path)
+        for name in MATRIX_FIELDS + ('rows', 'cols'):
+            if getattr(value, name) is not None:
+                np.save(os.path.join(path, name + '.npy'), getattr(value, name))
+        np.savez(os.path.join(path, 'labels.npz'), countries=value.countries.to_numpy(), products=value.products.to_numpy(),
+                 index=value.index.to_numpy(), work_dir=np.array(value.work_dir or ''))
+        return 'panel'
+    if isinstance(value, np.ndarray):
+        np.save(path + '.npy', value)
+        return 'npy'
+    with open(path + '.pkl', 'wb') as f:
+        pickle.dump(value, f)
+    return 'pkl'
+
+def _load_artifact(path: str, kind: str):
+    if kind == 'parquet':
+        return pd.read_parquet(path + '.parquet')
+    if kind == 'panel':
+        with np.load(os.path.join(path, 'labels.npz'), allow_pickle=True) as labels:
+            labels = {name: labels[name] for name in labels.files}
+        arrays = {name[:-4]: np.load(os.path.join(path, name), mmap_mode='r') for name in os.listdir(path) if name.endswith('.npy')}
+        return CountryProductPanel(
+            countries=pd.Index(labels['countries'], name='country_iso3_code'),
+            products=pd.Index(labels['products'], name='product_hs92_code'),
+            index=pd.Index(labels['index']),
+            work_dir=str(labels['work_dir']) or None,
+            **arrays,
+        )
+    if kind == 'npy':
+        return np.load(path + '.npy')
+    with open(path + '.pkl', 'rb') as f:
+        return pickle.load(f)
+
+@dataclass
+class _CachedArtifact:
+    path: str
+    kind: str
+
+def _resolve(value):
+    # Cached artifacts are only read from disk when a stage that has to run consumes them
+    return _load_artifact(value.path, value.kind) if isinstance(value, _CachedArtifact) else value
+
+def _downstream(stages: list[Stage], roots: set[str]) -> set[str]:
+    selected = set(roots)
+    for stage in stages:
+        if selected.intersection(stage.deps):
+            selected.add(stage.name)
+    return selected
+
+def run_stages(stages: list[Stage], config: dict, cache_dir: str | None = None, force: tuple[str, ...] = (), collect: tuple[str, ...] = (),
+               profiler=None, upstream: dict[str, tuple[str, dict]] | None = None) -> dict:
+    """Runs stages in declaration order, reusing cached artifacts whose input key is unchanged.
+
+    Forced stages (or 'all') and everything downstream of them are recomputed. Returns the
+    artifacts named in `collect`, taken from the last stage that produced each. A
+    profiling.StageProfiler records each stage's timings and artifact shapes when given.
+    `upstream` maps stages already run elsewhere (e.g. once for several years) to their
+    (key, artifacts); stages may depend on them as if they were declared first.
+    """
+    upstream = upstream or {}
+    names = [stage.name for stage in stages]
+    unknown = set(force) - set(names) - set(upstream) - {'all'}
+    if unknown:
+        raise ValueError(f"Unknown stages to force: {sorted(unknown)}; expected one of {list(upstream) + names}")
+    forced = set(names) if 'all' in force else _downstream(stages, set(force))
+
+    keys = {name: key for name, (key, _) in upstream.items()}
+    stage_outputs = {name: outputs for name, (_, outputs) in upstream.items()}
+    for stage in stages:
+        missing = [dep for dep in stage.deps if dep not in keys]
+        if missing:
+            raise ValueError(f"Stage '{stage.name}' depends on {missing}, which must be declared before it")
+        keys[stage.name] = stage_key(stage, config, [keys[dep] for dep in stage.deps])
+        # Later deps win when two upstream stages produce an artifact with the same name
+        inputs = {name: value for dep in stage.deps for name, value in stage_outputs[dep].items()}
+
+        stage_dir = os.path.join(cache_dir, stage.name, keys[stage.name]) if cache_dir else None
+        manifest_path = os.path.join(stage_dir, 'artifacts.json') if stage_dir else None
+        cached = (
+            manifest_path is not None
+            and stage.name not in forced
+            and not stage.always_run
+            and os.path.exists(manifest_path)
+            and all(os.path.exists(path) for path in stage.output_files(config))
+        )
+
+        if cached:
+            logging.info(f"Stage '{stage.name}': inputs unchanged, loading cached artifacts.")
+            with open(manifest_path) as f:
+                kinds = json.load(f)
+            outputs = {name: _CachedArtifact(os.path.join(stage_dir, name), kind) for name, kind in kinds.items()}
+            if profiler:
+                with profiler.stage(stage.name) as record:
+                    record['cached'] = True
+        else:
+            wanted = inspect.signature(stage.fn).parameters
+            resolved = {name: _resolve(value) for name, value in inputs.items() if name in wanted}
+            with profiler.stage(stage.name, resolved) if profiler else nullcontext({}) as record:
+                outputs = stage.fn(config, **resolved) or {}
+                record['cached'] = False
+                record['outputs'] = {name: artifact_shape(value) for name, value in outputs.items()}
+            if stage_dir:
+                shutil.rmtree(os.path.join(cache_dir, stage.name), ignore_errors=True)
+                os.makedirs(stage_dir)
+                kinds = {name: _save_artifact(os.path.join(stage_dir, name), value) for name, value in outputs.items()}
+                with open(manifest_path, 'w') as f:
+                    json.dump(kinds, f)
+
+        stage_outputs[stage.name] = outputs
+    latest = {name: value for outputs in stage_outputs.values() for name, value in outputs.items()}
+    return {name: _resolve(latest[name]) for name in collect}
@@ -0,0 +1,84 @@
+import pandas as pd
+import numpy as np
+import logging
+from dataclasses import dataclass
+
+@dataclass
+class Dimension:
+    """A small table with one row per `key` value, joined onto long frames by integer position.
+
+    `attach` gathers the requested columns with `take`, so a join costs one key lookup per row
+    and one gather per column instead of a hash merge that copies the whole long frame.
+    Rows without a match get missing values, like a left merge.
+    """
+    key: str
+    table: pd.DataFrame
+
+    @property
+    def columns(self) -> list[str]:
+        return list(self.table.columns)
+
+    def positions(self, keys: pd.Series) -> np.ndarray:
+        """Row position of each key in the table (-1 when absent); categorical keys are looked up once per category."""
+        if isinstance(keys.dtype, pd.CategoricalDtype):
+            lookup = np.append(self.table.index.get_indexer(keys.cat.categories), -1)
+            return lookup[keys.cat.codes.to_numpy()]
+        return self.table.index.get_indexer(keys)
+
+    def attach(self, df: pd.DataFrame, columns: list[str] | None = None, positions: np.ndarray | None = None) -> pd.DataFrame:
+        """Adds `columns` (all by default, skipping ones already present) to `df` in place and returns it."""
+        columns = [col for col in (self.columns if columns is None else columns) if col not in df.columns]
+        if columns:
+            positions = self.positions(df[self.key]) if positions is None else positions
+            for col in columns:
+                values = self.table[col]
+                values = values.array if isinstance(values.dtype, pd.api.extensions.ExtensionDtype) else values.to_numpy()
+                df[col] = pd.api.extensions.take(values, positions, allow_fill=True)
+        return df
+
+    def order(self, columns: list[str], after: str) -> list[str]:
+        """Column order with this dimension's columns placed, in table order, right after `after`."""
+        block = [col for col in self.columns if col in columns]
+        rest = [col for col in columns if col not in block]
+        split = rest.index(after) + 1
+        return rest[:split] + block + rest[split:]
+
+def build_dimension(table: pd.DataFrame, key: str) -> Dimension:
+    """Indexes `table` by `key`, keeping the first row when a key repeats."""
+    duplicated = table[key].duplicated()
+    if duplicated.any():
+        logging.warning(f"Duplicate {key} values in dimension table, keeping the first row: {table.loc[duplicated, key].unique().tolist()}")
+        table = table[~duplicated]
+    return Dimension(key, table.set_index(key))
+
+def build_product_dimension(product_meta: pd.DataFrame, vectors: pd.DataFrame) -> Dimension:
+    """One product table indexed by product_hs92_code: metadata columns followed by the layout columns."""
+    meta = build_dimension(product_meta, 'product_hs92_code').table
+    layout = build_dimension(vectors, 'product_hs92_code').table
+    return Dimension('product_hs92_code', meta.join(layout, how='outer'))
+
+def _integer_key(values: pd.Series) -> np.ndarray:
+    # Non-negative int64 per row; categoricals reuse their codes, integer keys are used directly
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.codes.to_numpy(dtype=np.int64) + 1
+    if pd.api.types.is_integer_dtype(values.dtype):
+        missing = values.isna().to_numpy()
+        key = values.to_numpy(dtype=np.int64, na_value=0)
+        return np.where(missing, 0, key - key[~missing].min(initial=0) + 1)
+    return pd.factorize(values)[0].astype(np.int64) + 1
+
+def duplicated_keys(df: pd.DataFrame, columns: list[str]) -> np.ndarray:
+    """Marks every row whose combination of `columns` occurs more than once (like duplicated(keep=False)).
+
+    The columns are folded into one int64 key and duplicates are found with a single sort.
+    """
+    combined = np.zeros(len(df), dtype=np.int64)
+    for col in columns:
+        key = _integer_key(df[col])
+        combined = combined * (int(key.max(initial=0)) + 1) + key
+    order = np.argsort(combined, kind='stable')
+    repeated = np.diff(combined[order]) == 0
+    duplicated = np.zeros(len(df), dtype=bool)
+    duplicated[order[1:][repeated]] = True
+    duplicated[order[:-1][repeated]] = True
+    return duplicated
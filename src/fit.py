@@ -1,20 +1,147 @@
 import pandas as pd
 import numpy as np
+import os
+import time
+import hashlib
+import tempfile
+from scipy import sparse
+
+def density_from_distance(distance: pd.Series) -> pd.Series:
+    return (1 - distance).clip(0, 1)
 
 def add_density_from_distance(df: pd.DataFrame) -> pd.DataFrame:
     """Calculates density from distance, clipped to [0, 1]."""
-    df["density"] = (1 - df["distance"]).clip(0, 1)
+    df["density"] = density_from_distance(df["distance"])
     return df
 
-def recompute_density_from_proximity(df: pd.DataFrame) -> pd.DataFrame:
-    """Recomputes density from proximity for QA."""
+def proximity_matrix(x_binary, out: np.ndarray | None = None, block_size: int = 1024) -> np.ndarray:
+    """Min-conditional proximity phi_{p,q} = min{P(p|q), P(q|p)} as a float32 product × product matrix.
+
+    Co-occurrence is counted on a CSR copy of the binary country × product matrix, `block_size`
+    product rows at a time, into `out` when given (e.g. a memmap); products nobody specializes
+    in get zero proximity.
+    """
+    x = sparse.csr_matrix(x_binary, dtype=np.float32)
+    x_t = x.T.tocsr()
+    n_products = x.shape[1]
+    phi = np.empty((n_products, n_products), dtype=np.float32) if out is None else out
+    ubiquity = np.asarray(x.multiply(x).sum(axis=0), dtype=np.float32).ravel()
+    for start in range(0, n_products, block_size):
+        stop = min(start + block_size, n_products)
+        block = (x_t[start:stop] @ x).toarray()
+        # min{C/u_p, C/u_q} == C / max(u_p, u_q)
+        denominator = np.maximum(ubiquity[start:stop, None], ubiquity[None, :])
+        np.divide(block, denominator, out=block, where=denominator > 0)
+        phi[start:stop] = block
+    return phi
+
+def density_from_proximity(x_binary, phi: np.ndarray, out: np.ndarray | None = None, block_size: int = 1024) -> np.ndarray:
+    """density_{c,p} = sum_q phi_{p,q} x_{c,q} / sum_q phi_{p,q} as a float32 country × product matrix.
+
+    Rows are computed `block_size` countries at a time into `out` when given (e.g. a memmap).
+    """
+    x = sparse.csr_matrix(x_binary, dtype=np.float32)
+    density = np.empty((x.shape[0], phi.shape[1]), dtype=np.float32) if out is None else out
+    for start in range(0, x.shape[0], block_size):
+        stop = min(start + block_size, x.shape[0])
+        density[start:stop] = x[start:stop] @ phi
+    total = phi.sum(axis=1, dtype=np.float32)
+    np.divide(density, total[None, :], out=density, where=total[None, :] > 0)
+    density[:, total == 0] = np.nan
+    return density
+
+def presence_fingerprint(x_binary, products=None) -> str:
+    """Content hash of a binary country × product matrix (and its product codes, when given)."""
+    x_binary = np.asarray(x_binary) != 0
+    digest = hashlib.sha1()
+    digest.update(np.asarray(x_binary.shape, dtype=np.int64).tobytes())
+    digest.update(np.packbits(x_binary, axis=1).tobytes())
+    if products is not None:
+        digest.update(np.asarray(products, dtype=np.int64).tobytes())
+    return digest.hexdigest()
+
+def evict_proximity_cache(cache_dir: str, max_bytes: int = 2 * 1024**3, max_age_days: float = 30) -> None:
+    """Deletes cached proximity matrices older than `max_age_days`, then the least recently used until under `max_bytes`."""
+    if not os.path.isdir(cache_dir):
+        return
+    # Other processes (e.g. multi-year workers) may evict the same entries concurrently
+    entries = []
+    for name in os.listdir(cache_dir):
+        if name.endswith(".npy"):
+            path = os.path.join(cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+    now = time.time()
+    total = sum(size for _, size, _ in entries)
+    for mtime, size, path in sorted(entries):
+        if now - mtime > max_age_days * 86400 or total > max_bytes:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            total -= size
+
+def cached_proximity_matrix(x_binary, year: int, threshold: float, products=None, cache_dir: str = "../data/cache/proximity",
+                            max_bytes: int = 2 * 1024**3, max_age_days: float = 30) -> np.ndarray:
+    """Returns proximity_matrix(x_binary) memory-mapped from a content-addressed `.npy` cache.
+
+    Entries are keyed by year, RCA threshold and presence_fingerprint, so threshold sweeps and
+    reruns on unchanged data reuse phi; hits refresh the entry's mtime for LRU eviction.
+    """
+    name = f"phi_{year}_rca{threshold:g}_{presence_fingerprint(x_binary, products)[:16]}.npy"
+    path = os.path.join(cache_dir, name)
+    try:
+        os.utime(path)
+        return np.load(path, mmap_mode="r")
+    except FileNotFoundError:
+        pass
+
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+    os.close(fd)
+    # phi is written straight into the mapped .npy file rather than built in RAM first
+    n_products = np.shape(x_binary)[1]
+    try:
+        phi = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float32, shape=(n_products, n_products))
+        proximity_matrix(x_binary, out=phi)
+        phi.flush()
+        del phi
+        # Concurrent writers of the same entry produce the same matrix, so the last rename wins
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    evict_proximity_cache(cache_dir, max_bytes, max_age_days)
+    try:
+        return np.load(path, mmap_mode="r")
+    except FileNotFoundError:
+        # Evicted by another process in between
+        return proximity_matrix(x_binary)
+
+def recompute_density_from_proximity(data, phi: np.ndarray | None = None):
+    """Recomputes density from proximity for QA.
+
+    Accepts a CountryProductPanel (fills `panel.density_recomputed` and returns the panel) or
+    the long frame with an `x_binary` column (returns it with `density_recomputed` added).
+    A precomputed `phi`, e.g. from cached_proximity_matrix, skips the co-occurrence product.
+    """
+    from panel import CountryProductPanel
+
+    if isinstance(data, CountryProductPanel):
+        n_products = len(data.products)
+        phi = proximity_matrix(data.binary, out=data.empty((n_products, n_products))) if phi is None else phi
+        data.density_recomputed = density_from_proximity(data.binary, phi, out=data.empty())
+        return data
+
+    df = data
     x_binary = df.pivot(index="country_iso3_code", columns="product_hs92_code", values="x_binary").fillna(0)
-    cooccurrence = x_binary.T @ x_binary
-    p_q_given_p = cooccurrence.T / np.diag(cooccurrence)
-    p_p_given_q = cooccurrence / np.diag(cooccurrence)
-    phi = np.minimum(p_q_given_p, p_p_given_q)
-    density_recomputed = (x_binary @ phi) / phi.sum(axis=1)
-    density_recomputed = density_recomputed.stack().reset_index()
-    density_recomputed.columns = ["country_iso3_code", "product_hs92_code", "density_recomputed"]
-    df = df.merge(density_recomputed, on=["country_iso3_code", "product_hs92_code"], how="left")
+    phi = proximity_matrix(x_binary.to_numpy()) if phi is None else phi
+    density = density_from_proximity(x_binary.to_numpy(), phi)
+    rows = x_binary.index.get_indexer(df["country_iso3_code"])
+    cols = x_binary.columns.get_indexer(df["product_hs92_code"])
+    df["density_recomputed"] = np.where(cols >= 0, density[rows, cols], np.nan)
     return df
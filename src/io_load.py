@@ -1,37 +1,195 @@
 import pandas as pd
 import numpy as np
 import os
+import json
+import shutil
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from typing import Iterable, Iterator
 
-def load_country_product(year: int, data_path: str = "../data/hs92_country_product_year_4.csv") -> pd.DataFrame:
-    dtype_spec = {
-        'country_id': 'uint16',
-        'country_iso3_code': 'str',
-        'product_id': 'uint16',
-        'product_hs92_code': 'str',
-        'year': 'uint16',
-        'export_value': 'uint64',
-        'import_value': 'int64',
-        'global_market_share': 'float32',
-        'export_rca': 'float32',
-        'distance': 'float32',
-        'cog': 'float32',
-        'pci': 'float32'
-    }
-    df = pd.read_csv(data_path, dtype=dtype_spec)
-    df = df[df["year"] == year]
-    if df.empty:
-        raise ValueError(f"{year} data not available")
+COUNTRY_PRODUCT_DTYPES = {
+    'country_id': 'uint16',
+    'country_iso3_code': 'str',
+    'product_id': 'uint16',
+    'product_hs92_code': 'str',
+    'year': 'uint16',
+    'export_value': 'uint64',
+    'import_value': 'int64',
+    'global_market_share': 'float32',
+    'export_rca': 'float32',
+    'distance': 'float32',
+    'cog': 'float32',
+    'pci': 'float32'
+}
+COUNTRY_PRODUCT_DROP = ['country_id', 'product_id', 'import_value', 'global_market_share']
+COUNTRY_PRODUCT_COLUMNS = ['country_iso3_code', 'product_hs92_code', 'export_value', 'export_rca', 'distance', 'cog', 'pci']
+# String keys repeated on every row are dictionary-encoded as categoricals; product codes are already Int32
+CATEGORICAL_COLUMNS = ['country_iso3_code', 'product_name', 'product_name_short', 'product_space_cluster_name']
+
+def normalize_hs92_code(codes: pd.Series) -> pd.Series:
+    """Casts HS92 codes to nullable Int32 in one vectorized pass; non-digit trade error codes become NA."""
+    arr = pa.array(codes, from_pandas=True)
+    if not pa.types.is_string(arr.type) and not pa.types.is_large_string(arr.type):
+        arr = arr.cast(pa.string())
+    arr = pc.if_else(pc.utf8_is_digit(arr), arr, pa.scalar(None, arr.type))
+    arr = arr.cast(pa.int32())
+    return pd.Series(arr.to_pandas(types_mapper={pa.int32(): pd.Int32Dtype()}.get).array, index=codes.index, name=codes.name)
+
+def _read_csv(data_path: str, dtype_spec: dict, engine: str = 'c', **kwargs) -> pd.DataFrame:
+    # The pyarrow engine keeps product codes as Arrow strings, so normalization never builds Python str objects
+    if engine == 'pyarrow' and 'product_hs92_code' in dtype_spec:
+        dtype_spec = {**dtype_spec, 'product_hs92_code': 'string[pyarrow]'}
+    return pd.read_csv(data_path, dtype=dtype_spec, engine=engine, **kwargs)
+
+def _source_signature(data_path: str) -> dict:
+    stat = os.stat(data_path)
+    return {'source': os.path.abspath(data_path), 'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+
+def _country_product_cache_path(data_path: str, cache_dir: str | None) -> str:
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(data_path), 'cache')
+    return os.path.join(cache_dir, os.path.splitext(os.path.basename(data_path))[0])
+
+def _harmonize_country_product(df: pd.DataFrame) -> pd.DataFrame:
     df.columns = [col.lower() for col in df.columns]
+    df['product_hs92_code'] = normalize_hs92_code(df['product_hs92_code'])
+    return df.drop(columns=COUNTRY_PRODUCT_DROP, errors='ignore')
+
+def _fill_country_product(df: pd.DataFrame) -> pd.DataFrame:
+    # Medians are taken per loaded year; product codes stay NA for trade error products
+    value_cols = [col for col in df.select_dtypes(include=np.number).columns if col not in ('product_hs92_code', 'year')]
+    df[value_cols] = df[value_cols].fillna(df[value_cols].median())
+    return encode_categories(df)
+
+def encode_categories(df: pd.DataFrame, columns: list[str] = CATEGORICAL_COLUMNS) -> pd.DataFrame:
+    """Casts the string key columns present in `df` to categoricals with sorted categories."""
+    for col in columns:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype('category')
+    return df
 
-    df['product_hs92_code'] = df['product_hs92_code'].apply(lambda x:x if x.isdigit() else np.nan)
-    df['product_hs92_code'] = df['product_hs92_code'].astype('Int32') # Nullable int for trade error products
+def align_categories(*columns: pd.Series) -> list[pd.Series]:
+    """Recodes categorical columns onto the sorted union of their categories.
 
-    numerical_cols = df.select_dtypes(include=np.number).columns.tolist()
-    df[numerical_cols] = df[numerical_cols].fillna(df[numerical_cols].median())
+    Frames keyed on columns with identical categories merge and concatenate on the integer
+    codes instead of hashing strings, e.g. country_iso3_code across the country-product and
+    country-year tables.
+    """
+    categories = pd.Index(sorted(set().union(*(col.cat.categories for col in columns))))
+    return [col.cat.set_categories(categories) for col in columns]
 
-    return df.drop(columns=['country_id', 'product_id', 'year', 'import_value', 'global_market_share'], errors='ignore')
+def concat_aligned(frames: list[pd.DataFrame], column: str = 'country_iso3_code') -> pd.DataFrame:
+    """Concatenates frames after aligning the categories of `column`, so the combined key stays categorical.
 
-def load_product_meta(data_path: str = "../data/product_hs92.csv") -> pd.DataFrame:
+    Frames from different years can cover different countries; without shared categories the
+    concatenated column would fall back to object strings.
+    """
+    for df, values in zip(frames, align_categories(*(df[column] for df in frames))):
+        df[column] = values
+    return pd.concat(frames, ignore_index=True)
+
+def build_country_product_cache(data_path: str = "../data/hs92_country_product_year_4.csv", cache_dir: str | None = None, chunksize: int = 2_000_000) -> str:
+    """Converts the country-product CSV into one Parquet file per year, keyed on the source mtime/size."""
+    cache_path = _country_product_cache_path(data_path, cache_dir)
+    signature = _source_signature(data_path)
+    manifest_path = os.path.join(cache_path, '_source.json')
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            if json.load(f) == signature:
+                return cache_path
+
+    tmp_path = cache_path + '.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    writers, schema = {}, None
+    try:
+        for chunk in pd.read_csv(data_path, dtype=COUNTRY_PRODUCT_DTYPES, chunksize=chunksize):
+            chunk = _harmonize_country_product(chunk)
+            for year, part in chunk.groupby('year', sort=False):
+                table = pa.Table.from_pandas(part.drop(columns='year'), schema=schema, preserve_index=False)
+                schema = table.schema
+                if year not in writers:
+                    writers[year] = pq.ParquetWriter(os.path.join(tmp_path, f'year={year}.parquet'), schema, compression='zstd')
+                writers[year].write_table(table)
+    finally:
+        for writer in writers.values():
+            writer.close()
+    with open(os.path.join(tmp_path, '_source.json'), 'w') as f:
+        json.dump(signature, f)
+
+    shutil.rmtree(cache_path, ignore_errors=True)
+    os.replace(tmp_path, cache_path)
+    return cache_path
+
+def load_country_product(year: int, data_path: str = "../data/hs92_country_product_year_4.csv", use_cache: bool = True, cache_dir: str | None = None, engine: str = 'c') -> pd.DataFrame:
+    if use_cache:
+        cache_path = build_country_product_cache(data_path, cache_dir)
+        year_path = os.path.join(cache_path, f'year={year}.parquet')
+        if not os.path.exists(year_path):
+            raise ValueError(f"{year} data not available")
+        df = pd.read_parquet(year_path, columns=COUNTRY_PRODUCT_COLUMNS)
+    else:
+        df = _read_csv(data_path, COUNTRY_PRODUCT_DTYPES, engine)
+        df = df[df["year"] == year]
+        if df.empty:
+            raise ValueError(f"{year} data not available")
+        df = _harmonize_country_product(df).drop(columns=['year'])
+
+    return _fill_country_product(df)
+
+def iter_country_product(years: Iterable[int], data_path: str = "../data/hs92_country_product_year_4.csv", use_cache: bool = True, cache_dir: str | None = None, chunksize: int = 1_000_000) -> Iterator[tuple[int, pd.DataFrame]]:
+    """Yields (year, frame) for each requested year in ascending order, with the same dtypes as load_country_product.
+
+    Without the cache, the CSV is streamed in chunks and only rows inside the year window are kept,
+    so memory scales with the window rather than the file.
+    """
+    years = sorted({int(year) for year in years})
+    if use_cache:
+        cache_path = build_country_product_cache(data_path, cache_dir)
+        for year in years:
+            year_path = os.path.join(cache_path, f'year={year}.parquet')
+            if not os.path.exists(year_path):
+                raise ValueError(f"{year} data not available")
+            yield year, _fill_country_product(pd.read_parquet(year_path, columns=COUNTRY_PRODUCT_COLUMNS))
+        return
+
+    keep = set(COUNTRY_PRODUCT_COLUMNS) | {'year'}
+    parts = {year: [] for year in years}
+    for chunk in pd.read_csv(data_path, dtype=COUNTRY_PRODUCT_DTYPES, usecols=lambda col: col.lower() in keep, chunksize=chunksize):
+        chunk.columns = [col.lower() for col in chunk.columns]
+        chunk = chunk[chunk['year'].isin(years)]
+        if chunk.empty:
+            continue
+        chunk = _harmonize_country_product(chunk)
+        for year, part in chunk.groupby('year', sort=False):
+            parts[year].append(part.drop(columns='year'))
+
+    for year in years:
+        if not parts[year]:
+            raise ValueError(f"{year} data not available")
+        df = pd.concat(parts.pop(year), ignore_index=True)
+        yield year, _fill_country_product(df)
+
+def available_years(data_path: str = "../data/hs92_country_product_year_4.csv", use_cache: bool = True, cache_dir: str | None = None, chunksize: int = 1_000_000) -> list[int]:
+    """Years present in the country-product data: the cache's year partitions, or the CSV's year column."""
+    if use_cache:
+        cache_path = build_country_product_cache(data_path, cache_dir)
+        return sorted(int(name[len('year='):-len('.parquet')]) for name in os.listdir(cache_path)
+                      if name.startswith('year=') and name.endswith('.parquet'))
+    years = set()
+    for chunk in pd.read_csv(data_path, usecols=lambda col: col.lower() == 'year', chunksize=chunksize):
+        years.update(chunk.iloc[:, 0].dropna().astype(int).unique().tolist())
+    return sorted(years)
+
+def load_country_product_years(years: Iterable[int], data_path: str = "../data/hs92_country_product_year_4.csv", use_cache: bool = True, cache_dir: str | None = None, chunksize: int = 1_000_000) -> pd.DataFrame:
+    """Concatenates iter_country_product frames into one long frame with a year column."""
+    frames = []
+    for year, df in iter_country_product(years, data_path, use_cache, cache_dir, chunksize):
+        frames.append(df.assign(year=np.uint16(year)))
+    return concat_aligned(frames)
+
+def load_product_meta(data_path: str = "../data/product_hs92.csv", engine: str = 'c') -> pd.DataFrame:
     dtype_spec = {
         'product_id': 'uint16',
         'product_hs92_code': 'str',
@@ -43,29 +201,28 @@ def load_product_meta(data_path: str = "../data/product_hs92.csv") -> pd.DataFra
         'show_feasibility': 'bool',
         'natural_resource': 'bool'
     }
-    df = pd.read_csv(data_path, dtype=dtype_spec)
+    df = _read_csv(data_path, dtype_spec, engine)
     df.columns = [col.lower() for col in df.columns]
 
-    df['product_hs92_code'] = df['product_hs92_code'].apply(lambda x:x if x.isdigit() else np.nan)
-    df['product_hs92_code'] = df['product_hs92_code'].astype('Int32') # Nullable int for trade error products
+    df['product_hs92_code'] = normalize_hs92_code(df['product_hs92_code'])
     # df = df.dropna(subset=['product_hs92_code'])
 
-    return df.drop(columns=['product_level', 'product_id', 'green_product', 'product_id_hierarchy'], errors='ignore')
+    df = df.drop(columns=['product_level', 'product_id', 'green_product', 'product_id_hierarchy'], errors='ignore')
+    return encode_categories(df)
 
-def load_product_space_vectors(data_path: str = "../data/umap_layout_hs92.csv") -> pd.DataFrame:
+def load_product_space_vectors(data_path: str = "../data/umap_layout_hs92.csv", engine: str = 'c') -> pd.DataFrame:
     dtype_spec = {
         'product_hs92_code': 'str',
         'product_space_x': 'float64',
         'product_space_y': 'float64',
         'product_space_cluster_name': 'str'
     }
-    df = pd.read_csv(data_path, dtype=dtype_spec)
+    df = _read_csv(data_path, dtype_spec, engine)
     df.columns = [col.lower() for col in df.columns]
 
-    df['product_hs92_code'] = df['product_hs92_code'].apply(lambda x:x if x.isdigit() else np.nan)
-    df['product_hs92_code'] = df['product_hs92_code'].astype('Int32') # Nullable int for trade error products
+    df['product_hs92_code'] = normalize_hs92_code(df['product_hs92_code'])
 
-    return df
+    return encode_categories(df)
 
 def load_product_space_edges(data_path: str = "../data/top_edges_hs92.csv") -> pd.DataFrame:
     dtype_spec = {
@@ -91,4 +248,4 @@ def load_country_year(data_path: str = "../data/hs92_country_year.csv") -> pd.Da
     df = pd.read_csv(data_path, dtype=dtype_spec)
     df.columns = [col.lower() for col in df.columns]
     df = df.rename(columns={"export_value": "export_value_country_total"})
-    return df.drop(columns=['import_value', ])
\ No newline at end of file
+    return encode_categories(df.drop(columns=['import_value', ]))
\ No newline at end of file
@@ -0,0 +1,123 @@
+import pandas as pd
+import numpy as np
+import os
+import tempfile
+from dataclasses import dataclass, field, replace
+
+from fit import density_from_distance
+
+# Country × product matrices carried by the panel (optional ones are None until computed)
+MATRIX_FIELDS = ('export_rca', 'export_value', 'density', 'binary', 'density_recomputed', 'share', 'rel_presence', 'abs_presence')
+
+def allocate_matrix(shape: tuple[int, ...], dtype, work_dir: str | None = None) -> np.ndarray:
+    """Zero-filled array in RAM, or an `np.memmap` backed by a scratch file under `work_dir`.
+
+    The scratch file is unlinked once mapped, so its disk space is reclaimed when the array is
+    released, and slices of the memmap are views paged in by the OS on access.
+    """
+    # Empty files cannot be mapped
+    if work_dir is None or 0 in shape:
+        return np.zeros(shape, dtype=dtype)
+    os.makedirs(work_dir, exist_ok=True)
+    fd, path = tempfile.mkstemp(dir=work_dir, suffix='.mmap')
+    os.close(fd)
+    matrix = np.memmap(path, dtype=dtype, mode='w+', shape=shape)
+    try:
+        os.remove(path)
+    except OSError:
+        pass  # Windows keeps mapped files; they are left in work_dir
+    return matrix
+
+@dataclass
+class CountryProductPanel:
+    """Dense country × product matrices shared across presence, fit and similarity.
+
+    `rows`/`cols` map each row of the long frame the panel was built from onto the matrices
+    (-1 for rows without a valid product code), so results can be written back with `take`.
+    With a `work_dir`, matrices derived from the panel are memory-mapped there (see allocate_matrix).
+    """
+    countries: pd.Index
+    products: pd.Index
+    export_rca: np.ndarray
+    export_value: np.ndarray
+    density: np.ndarray
+    binary: np.ndarray | None = None
+    density_recomputed: np.ndarray | None = None
+    share: np.ndarray | None = None
+    rel_presence: np.ndarray | None = None
+    abs_presence: np.ndarray | None = None
+    index: pd.Index = field(default_factory=lambda: pd.RangeIndex(0), repr=False)
+    rows: np.ndarray = field(default_factory=lambda: np.empty(0, dtype=np.intp), repr=False)
+    cols: np.ndarray = field(default_factory=lambda: np.empty(0, dtype=np.intp), repr=False)
+    work_dir: str | None = field(default=None, repr=False)
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return len(self.countries), len(self.products)
+
+    def empty(self, shape: tuple[int, ...] | None = None, dtype=np.float32) -> np.ndarray:
+        """Allocates a (by default country × product) matrix in RAM or under the panel's work_dir."""
+        return allocate_matrix(self.shape if shape is None else shape, dtype, self.work_dir)
+
+    def take(self, matrix: np.ndarray, name: str | None = None) -> pd.Series:
+        """Gathers a country × product matrix back onto the long frame's rows."""
+        valid = (self.rows >= 0) & (self.cols >= 0)
+        values = np.full(len(self.rows), np.nan, dtype=np.result_type(matrix.dtype, np.float32))
+        values[valid] = matrix[self.rows[valid], self.cols[valid]]
+        return pd.Series(values, index=self.index, name=name)
+
+    def frame(self, matrix: np.ndarray) -> pd.DataFrame:
+        """Labels a country × product matrix like the former pivot tables."""
+        return pd.DataFrame(matrix, index=self.countries, columns=self.products)
+
+    def drop_products(self, codes) -> "CountryProductPanel":
+        """Returns a panel without the given product codes; long-frame mappings are dropped."""
+        keep = ~self.products.isin(codes)
+        sliced = {}
+        for name in MATRIX_FIELDS:
+            matrix = getattr(self, name)
+            if matrix is not None:
+                sliced[name] = np.compress(keep, matrix, axis=1, out=self.empty((len(self.countries), int(keep.sum())), matrix.dtype))
+        return replace(self, products=self.products[keep], index=pd.RangeIndex(0), rows=np.empty(0, dtype=np.intp), cols=np.empty(0, dtype=np.intp), **sliced)
+
+def _scatter(shape: tuple[int, int], rows: np.ndarray, cols: np.ndarray, values: np.ndarray, dtype, work_dir: str | None = None) -> np.ndarray:
+    matrix = allocate_matrix(shape, dtype, work_dir)
+    matrix[rows, cols] = values
+    return matrix
+
+def _country_positions(countries: pd.Series) -> tuple[pd.Index, np.ndarray]:
+    # Sorted observed countries and each row's position; categorical keys are remapped through their codes
+    if not isinstance(countries.dtype, pd.CategoricalDtype):
+        index = pd.Index(np.sort(countries.unique()), name='country_iso3_code')
+        return index, index.get_indexer(countries)
+    codes = countries.cat.codes.to_numpy()
+    observed = np.flatnonzero(np.bincount(codes[codes >= 0], minlength=len(countries.cat.categories)))
+    observed = observed[np.argsort(countries.cat.categories[observed])]
+    position = np.full(len(countries.cat.categories) + 1, -1, dtype=np.intp)
+    position[observed] = np.arange(len(observed))
+    return pd.Index(countries.cat.categories[observed], name='country_iso3_code'), position[codes]
+
+def build_panel(df: pd.DataFrame, work_dir: str | None = None) -> CountryProductPanel:
+    """Builds the shared panel from the Step 1 long frame in one scatter per metric (missing pairs are 0).
+
+    With `work_dir`, the matrices are memory-mapped scratch files instead of RAM arrays.
+    """
+    countries, rows = _country_positions(df['country_iso3_code'])
+    products = pd.Index(np.sort(df['product_hs92_code'].dropna().unique().astype(np.int32)), name='product_hs92_code')
+    cols = products.get_indexer(df['product_hs92_code'].fillna(-1).to_numpy(dtype=np.int32))
+    valid = (rows >= 0) & (cols >= 0)
+    r, c = rows[valid], cols[valid]
+    shape = (len(countries), len(products))
+
+    density = df['density'] if 'density' in df.columns else density_from_distance(df['distance'])
+    return CountryProductPanel(
+        countries=countries,
+        products=products,
+        export_rca=_scatter(shape, r, c, df['export_rca'].to_numpy(dtype=np.float32)[valid], np.float32, work_dir),
+        export_value=_scatter(shape, r, c, df['export_value'].to_numpy(dtype=np.float32)[valid], np.float32, work_dir),
+        density=_scatter(shape, r, c, density.to_numpy(dtype=np.float32)[valid], np.float32, work_dir),
+        index=df.index,
+        rows=rows,
+        cols=cols,
+        work_dir=work_dir,
+    )
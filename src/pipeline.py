@@ -3,178 +3,296 @@ import pandas as pd
 import numpy as np
 import logging
 import os
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+from dag import Stage, run_stages, stage_key
+from artifacts import write_table, atomic_output
+from profiling import StageProfiler
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def main():
-    """
-    Main function to run the data processing pipeline.
-    """
-    logging.info("Starting the pipeline...")
-
-    # Load configuration
-    with open('config.yaml', 'r') as f:
-        config = yaml.safe_load(f)
-    logging.info(f"Configuration loaded: {config}")
-
-    # Set random seed
-    np.random.seed(config['random_seed'])
-    logging.info(f"Random seed set to {config['random_seed']}")
-
-    # Persist a config snapshot to outputs/
-    if not os.path.exists('outputs'):
-        os.makedirs('outputs')
-    with open('outputs/config_snapshot.yaml', 'w') as f:
-        yaml.dump(config, f)
-    logging.info("Configuration snapshot saved to outputs/config_snapshot.yaml")
-
-
-    # --- 1) Load and harmonize ---
-    logging.info("Step 1: Load and harmonize data...")
-    from io_load import load_country_product, load_product_meta, load_product_space_vectors, load_product_space_edges, load_country_year
+DATA_DIR = '../data'
+COUNTRY_PRODUCT_PATH = f'{DATA_DIR}/hs92_country_product_year_4.csv'
+PRODUCT_META_PATH = f'{DATA_DIR}/product_hs92.csv'
+LAYOUT_PATH = f'{DATA_DIR}/umap_layout_hs92.csv'
+EDGES_PATH = f'{DATA_DIR}/top_edges_hs92.csv'
+COUNTRY_YEAR_PATH = f'{DATA_DIR}/hs92_country_year.csv'
+# Run artifacts live under config['output_dir']
+OUTPUT_DIR = 'outputs'
+STAGE_CACHE_DIR = '.stage_cache'
+RUN_PROFILE = 'run_profile.json'
+CONFIG_SNAPSHOT = 'config_snapshot.yaml'
+DIMENSION_TABLES = ('products', 'product_meta', 'vectors', 'edges', 'country_year')
+
+
+# --- 1) Load and harmonize ---
+def dimensions_stage(config):
+    logging.info("Step 1: Loading product and country tables...")
+    from io_load import load_product_meta, load_product_space_vectors, load_product_space_edges, load_country_year
+    from dimensions import build_product_dimension
+
+    # Year-independent tables, loaded once for all years of a multi-year run
+    product_meta = load_product_meta(PRODUCT_META_PATH)
+    vectors = load_product_space_vectors(LAYOUT_PATH)
+    edges = load_product_space_edges(EDGES_PATH)
+    country_year = load_country_year(COUNTRY_YEAR_PATH)
+
+    # Product metadata and layout form one dimension table; stages attach the columns they read
+    products = build_product_dimension(product_meta, vectors)
+    return {'products': products, 'product_meta': product_meta, 'vectors': vectors, 'edges': edges, 'country_year': country_year}
+
+def load_stage(config, country_year):
+    logging.info(f"Step 1: Load and harmonize {config['year']} country-product data...")
+    from io_load import load_country_product, align_categories
+    from dimensions import duplicated_keys
 
     # Load data
-    df = load_country_product(config['year'])
-    product_meta = load_product_meta()
-    vectors = load_product_space_vectors()
-    edges = load_product_space_edges()
-    country_year = load_country_year()
-
-    # Join and merge
-    df = df.merge(product_meta, on='product_hs92_code', how='left')
-    df = df.merge(vectors, on='product_hs92_code', how='left')
-
-    # QA
-    corrupted_codes = df[df.duplicated(subset=['country_iso3_code', 'product_hs92_code'], keep=False)]['product_hs92_code'].unique()
-    if corrupted_codes:
+    df = load_country_product(config['year'], COUNTRY_PRODUCT_PATH, use_cache=config.get('data_cache', True))
+    # Country codes share one set of categories, so Step 8 joins on integer codes; the shared table is left as loaded
+    country_year = country_year.copy(deep=False)
+    df['country_iso3_code'], country_year['country_iso3_code'] = align_categories(df['country_iso3_code'], country_year['country_iso3_code'])
+
+    # QA: duplicate country-product pairs in one sort over the integer keys
+    key_columns = ['country_iso3_code', 'product_hs92_code']
+    corrupted_codes = df.loc[duplicated_keys(df, key_columns), 'product_hs92_code'].unique()
+    if len(corrupted_codes):
         logging.info(f'corrupted product_hs92_codes: {corrupted_codes.tolist()}')
         df = df[~df['product_hs92_code'].isin(corrupted_codes)]
-    
-    assert df[['country_iso3_code', 'product_hs92_code']].duplicated().sum() == 0, "Country-product codes are not unique for the given year."
+
+    assert not duplicated_keys(df, key_columns).any(), "Country-product codes are not unique for the given year."
     assert df['distance'].between(0, 1).all(), "Distance values are not all between 0 and 1."
     logging.info("Step 1 completed.")
+    return {'df': df, 'country_year': country_year}
+
+
+# --- 1b) Trailing-window smoothing ---
+def smoothing_stage(config, df):
+    if config['smoothing_years'] > 1:
+        logging.info(f"Step 1b: Applying {config['smoothing_years']}-year trailing average for export_rca, density and export_value...")
+        from smoothing import smooth_trailing
+
+        # The shallow copy keeps the loaded frame unchanged when columns are replaced
+        df = smooth_trailing(df.copy(deep=False), config['year'], config['smoothing_years'], work_dir=config.get('work_dir'),
+                             data_path=COUNTRY_PRODUCT_PATH, use_cache=config.get('data_cache', True))
+        logging.info("Step 1b completed.")
+    return {'df': df}
+
 
+# --- 2) Presence metrics ---
+def _peer_groups(config, panel):
+    """Peer sets for peer-relative presence: 'global', 'knn' (most similar countries by RCA) or a CSV of country_iso3_code, peer_group."""
+    from presence import peer_groups, nearest_peer_groups
 
-    # --- 2) Presence metrics ---
+    peer_group = config.get('peer_group', 'global')
+    if peer_group == 'global':
+        return None
+    if peer_group == 'knn':
+        from similarity import country_similarity_cosine
+        return nearest_peer_groups(country_similarity_cosine(panel), panel.countries, k=config.get('peer_k', 10))
+    labels = pd.read_csv(peer_group, dtype=str).set_index('country_iso3_code')['peer_group']
+    return peer_groups(panel.countries, labels)
+
+def presence_stage(config, df):
     logging.info("Step 2: Calculate presence metrics...")
     from presence import add_rca_binary, add_peer_relative_presence
+    from panel import build_panel
+
+    # New columns go on a shallow copy so the upstream frame is left as its stage produced it
+    df = df.copy(deep=False)
 
-    df = add_rca_binary(df, threshold=config['rca_threshold'])
-    df = add_peer_relative_presence(df)
+    # Country × product matrices shared by presence, fit and similarity (memory-mapped under work_dir when set)
+    panel = build_panel(df, work_dir=config.get('work_dir'))
+    panel = add_rca_binary(panel, threshold=config['rca_threshold'])
+    panel = add_peer_relative_presence(panel, peers=_peer_groups(config, panel))
+
+    # New columns are written into the frame; no full copies of the merged panel
+    add_rca_binary(df, threshold=config['rca_threshold'], mode='inplace')
+    for name in ('share', 'rel_presence', 'abs_presence'):
+        df[name] = panel.take(getattr(panel, name))
 
     logging.info("Step 2 completed.")
+    return {'df': df, 'panel': panel}
 
 
-    # --- 3) Fit metric ---
+# --- 3) Fit metric ---
+def fit_stage(config, df, panel):
     logging.info("Step 3: Calculate fit metrics...")
-    from fit import add_density_from_distance, recompute_density_from_proximity
+    from fit import add_density_from_distance, recompute_density_from_proximity, cached_proximity_matrix
 
-    df = add_density_from_distance(df)
+    df = add_density_from_distance(df.copy(deep=False))
 
     if config['fit_recompute']:
         logging.info("Recomputing density from proximity for QA...")
-        df = recompute_density_from_proximity(df)
+        phi = None
+        if config.get('proximity_cache', True):
+            phi = cached_proximity_matrix(panel.binary, config['year'], config['rca_threshold'], products=panel.products)
+        panel = recompute_density_from_proximity(panel, phi=phi)
+        df['density_recomputed'] = panel.take(panel.density_recomputed)
         # QA: per-country correlation between density and density_recomputed
-        correlation = df.groupby('country_iso3_code')[['density', 'density_recomputed']].corr().unstack().iloc[:, 1]
+        correlation = df.groupby('country_iso3_code', observed=True)[['density', 'density_recomputed']].corr().unstack().iloc[:, 1]
         logging.info(f"Correlation between provided and recomputed density (avg): {correlation.mean():.2f}")
 
-    logging.info("Step 3 completed.")
-
-
     # --- 4) Clusters ---
-    logging.info("Step 4: Assigning clusters...")
     # Clusters are already assigned from the layout file in Step 1.
-    logging.info("Step 4 completed.")
-
+    logging.info("Step 3 completed.")
+    return {'df': df, 'panel': panel}
 
-    # --- 5) Visualizations ---
-    logging.info("Step 5: Creating visualizations...")
-    from viz import plot_product_space, plot_opportunities_scatter
 
-    # Create a directory for the country
-    for country_iso in df['country_iso3_code'].unique():
-        country_df = df[df['country_iso3_code'] == country_iso]
-        output_dir = f"outputs/{country_iso}"
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
+# --- 3b) Economic complexity ---
+def complexity_stage(config, df, panel, product_meta, country_year):
+    if config.get('complexity', 'atlas') != 'recompute':
+        return {}
+    logging.info("Step 3b: Recomputing ECI, PCI, COG and COI from presence...")
+    from fit import cached_proximity_matrix, proximity_matrix
+    from complexity import recompute_complexity
 
-        # Product Space Map
-        fig_ps = plot_product_space(country_df, vectors, edges, product_meta)
-        fig_ps.write_html(f"{output_dir}/product_space.html")
+    # Complexity uses the same presence (threshold, smoothing) and product set as the ranking
+    complexity_panel = panel
+    if config['exclude_natural_resources']:
+        complexity_panel = panel.drop_products(product_meta.loc[product_meta['natural_resource'], 'product_hs92_code'].dropna())
+    if config.get('proximity_cache', True):
+        phi = cached_proximity_matrix(complexity_panel.binary, config['year'], config['rca_threshold'], products=complexity_panel.products)
+    else:
+        phi = proximity_matrix(complexity_panel.binary)
+    country_complexity, product_complexity, cog = recompute_complexity(complexity_panel, phi)
+
+    # Products left out of the complexity panel get NaN pci and cog
+    keep = panel.products.get_indexer(complexity_panel.products)
+    pci = np.full(len(panel.products), np.nan, dtype=np.float32)
+    pci[keep] = product_complexity['pci'].to_numpy()
+    full_cog = panel.empty()
+    full_cog[:] = np.nan
+    full_cog[:, keep] = cog
+    df = df.copy(deep=False)
+    df['pci'] = panel.take(np.broadcast_to(pci, panel.shape))
+    df['cog'] = panel.take(full_cog)
+
+    # Step 8 reads eci, coi and diversity for the configured year from country_year
+    country_year = country_year.copy()
+    current = country_year['year'] == config['year']
+    for col in ('eci', 'coi', 'diversity'):
+        country_year.loc[current, col] = country_complexity[col].reindex(country_year.loc[current, 'country_iso3_code']).to_numpy(dtype=np.float32)
+
+    write_table(country_complexity, f"{config['output_dir']}/complexity_country", config['output_format'], index=True)
+    write_table(product_complexity, f"{config['output_dir']}/complexity_product", config['output_format'], index=True)
+    logging.info(f"Recomputed ECI for {country_complexity['eci'].notna().sum()} countries and PCI for {product_complexity['pci'].notna().sum()} products.")
+    logging.info("Step 3b completed.")
+    return {'df': df, 'country_year': country_year, 'country_complexity': country_complexity, 'product_complexity': product_complexity}
+
+
+# --- 5) Visualizations ---
+def visualization_stage(config, df, products, vectors, edges, product_meta):
+    logging.info("Step 5: Creating visualizations...")
+    from viz import render_country_figures, RENDER_COLUMNS
 
-        # Growth Opportunities Scatter
-        fig_opp = plot_opportunities_scatter(country_df)
-        fig_opp.write_html(f"{output_dir}/opportunities_scatter.html")
+    # Product names are only attached to the columns the figures read
+    render_df = df[[col for col in RENDER_COLUMNS + ['rel_presence'] if col in df.columns]].copy()
+    render_df = products.attach(render_df, ['product_name'])
+    rendered = render_country_figures(render_df, vectors, edges, product_meta, output_root=config['output_dir'],
+                                      workers=config.get('render_workers', 1), shared_plotlyjs=config.get('shared_plotlyjs', True),
+                                      incremental=config.get('incremental_render', True), presence=config['presence_metric'])
+    logging.info(f"Rendered figures for {len(rendered)} countries; {df['country_iso3_code'].nunique() - len(rendered)} unchanged countries skipped.")
 
     logging.info("Step 5 completed.")
+    return {}
 
 
-    # --- 6) Opportunity ranking ---
+# --- 6) Opportunity ranking ---
+def ranking_stage(config, df, products):
     logging.info("Step 6: Ranking opportunities...")
-    
+    from ranking import top_k_with_names
+
+    df = products.attach(df.copy(deep=False), ['product_name', 'natural_resource'])
+
     def z_score(series):
         return (series - series.mean()) / series.std()
 
+    # Presence is export_rca against rca_threshold, or rel_presence against 1 for peer_relative
+    presence, presence_split = 'export_rca', config['rca_threshold']
+    if config['presence_metric'] == 'peer_relative':
+        presence, presence_split = 'rel_presence', 1.0
+
     # Candidate filter
     df['is_candidate'] = (
-        (df['density'] >= df.groupby('country_iso3_code')['density'].transform('median')) &
-        (df['export_rca'] < config['rca_threshold'])
+        (df['density'] >= df.groupby('country_iso3_code', observed=True)['density'].transform('median')) &
+        (df[presence] < presence_split)
     )
 
     # Scoring
     df['score'] = (
-        z_score(df['density']) + 
-        0.5 * z_score(df['pci']) + 
-        0.5 * z_score(df['cog']) - 
-        0.5 * z_score(df['export_rca'])
+        z_score(df['density']) +
+        0.5 * z_score(df['pci']) +
+        0.5 * z_score(df['cog']) -
+        0.5 * z_score(df[presence])
     )
 
     if config['exclude_natural_resources']:
         df = df[~df['natural_resource']]
 
     # Output top-N per country
-    top_opportunities = (
-        df[df['is_candidate']]
-        .groupby('country_iso3_code')
-        .apply(lambda x: x.nlargest(10, 'score'))
-        .reset_index(drop=True)
+    top_opportunities, top_opportunity_names = top_k_with_names(
+        df[df['is_candidate']], 'country_iso3_code', 'score', k=config.get('top_n_opportunities', 10)
     )
-    top_opportunities.to_csv("outputs/top_opportunities.csv", index=False)
+    # The full product attributes are only gathered for the top-N rows
+    top_opportunities = products.attach(top_opportunities)
+    top_opportunities = top_opportunities[products.order(list(top_opportunities.columns), after='pci')]
+    write_table(top_opportunities, f"{config['output_dir']}/top_opportunities", config['output_format'])
 
     logging.info("Step 6 completed.")
+    return {'df': df, 'top_opportunities': top_opportunities, 'top_opportunity_names': top_opportunity_names}
 
 
-    # --- 7) Country similarity ---
+# --- 7) Country similarity ---
+def similarity_stage(config, panel, product_meta):
     logging.info("Step 7: Calculating country similarity...")
-    from similarity import country_similarity_cosine, country_similarity_jaccard
+    from similarity import country_similarity_cosine, country_similarity_jaccard, build_similarity_index
 
-    # Build RCA matrix
-    M_rca = df.pivot(index='country_iso3_code', columns='product_hs92_code', values='export_rca').fillna(0.0)
-
-    # Compute cosine similarity
-    similarity_cosine_df = country_similarity_cosine(df)
-    similarity_cosine_df.to_csv("outputs/similarity_cosine.csv")
-    logging.info("Cosine similarity matrix saved to outputs/similarity_cosine.csv")
+    # Similarity runs on the same product set as the ranking
+    similarity_panel = panel
+    if config['exclude_natural_resources']:
+        similarity_panel = panel.drop_products(product_meta.loc[product_meta['natural_resource'], 'product_hs92_code'].dropna())
+
+    # Top-k cosine neighbours per country; the full dense matrix is opt-in
+    similarity_index = build_similarity_index(similarity_panel, k=config.get('similarity_top_k', 20))
+    index_path = f"{config['output_dir']}/similarity_index.npz"
+    with atomic_output(index_path) as tmp_path:
+        similarity_index.save(tmp_path)
+    logging.info(f"Cosine similarity top-k index saved to {index_path}")
+    outputs = {}
+
+    if config.get('similarity_dense', False):
+        similarity_cosine_df = country_similarity_cosine(similarity_panel)
+        path = write_table(similarity_cosine_df, f"{config['output_dir']}/similarity_cosine", config['output_format'], index=True)
+        logging.info(f"Cosine similarity matrix saved to {path}")
+        outputs['similarity_cosine'] = similarity_cosine_df
 
     if config['similarity_metric'] == 'jaccard_binary':
         logging.info("Computing Jaccard similarity...")
-        similarity_jaccard_df = country_similarity_jaccard(df)
-        similarity_jaccard_df.to_csv("outputs/similarity_jaccard.csv")
-        logging.info("Jaccard similarity matrix saved to outputs/similarity_jaccard.csv")
+        similarity_jaccard_df = country_similarity_jaccard(similarity_panel)
+        path = write_table(similarity_jaccard_df, f"{config['output_dir']}/similarity_jaccard", config['output_format'], index=True)
+        logging.info(f"Jaccard similarity matrix saved to {path}")
+        outputs['similarity_jaccard'] = similarity_jaccard_df
 
     logging.info("Step 7 completed.")
+    return outputs
 
 
-    # --- 8) Country context and summaries ---
+# --- 8) Country context and summaries ---
+def summary_stage(config, df, top_opportunity_names, country_year, products):
     logging.info("Step 8: Adding country context and summaries...")
+    from ranking import top_k_with_names
+    from dimensions import build_dimension
 
-    # Attach country-year data
-    df = df.merge(country_year[['country_iso3_code', 'export_value_total', 'eci', 'growth_proj', 'diversity', 'coi']],
-                  on='country_iso3_code', how='left')
+    # Attach country-year data by position on the shared country codes; the shallow copy keeps the ranking frame unchanged
+    country_year = country_year[country_year['year'] == config['year']].rename(columns={'export_value_country_total': 'export_value_total'})
+    countries = build_dimension(country_year[['country_iso3_code', 'export_value_total', 'eci', 'growth_proj', 'diversity', 'coi']], 'country_iso3_code')
+    df = countries.attach(df.copy(deep=False))
+    products.attach(df, ['product_space_cluster_name'])
 
     # Produce per-country summaries
-    country_summary = df.groupby('country_iso3_code').agg(
+    country_summary = df.groupby('country_iso3_code', observed=True).agg(
         export_value_total=('export_value_total', 'first'),
         eci=('eci', 'first'),
         growth_proj=('growth_proj', 'first'),
@@ -185,57 +303,224 @@ def main():
 
     # Top strengths: high presence and high fit
     strengths = df[(df['export_rca'] >= config['rca_threshold']) & (df['density'] >= df['density'].median())]
-    top_strengths = strengths.groupby('country_iso3_code').apply(lambda x: x.nlargest(5, 'export_rca'))
-    top_strengths = top_strengths.groupby('country_iso3_code')['product_name'].apply(lambda x: '; '.join(x)).rename('top_strengths')
-    country_summary = country_summary.merge(top_strengths, on='country_iso3_code', how='left')
+    _, top_strengths = top_k_with_names(strengths, 'country_iso3_code', 'export_rca', k=config.get('top_n_strengths', 5))
+    country_summary = country_summary.merge(top_strengths.rename('top_strengths'), on='country_iso3_code', how='left')
 
     # Top opportunities (from step 6)
-    top_opportunities_summary = top_opportunities.groupby('country_iso3_code')['product_name'].apply(lambda x: '; '.join(x)).rename('top_opportunities')
-    country_summary = country_summary.merge(top_opportunities_summary, on='country_iso3_code', how='left')
+    country_summary = country_summary.merge(top_opportunity_names.rename('top_opportunities'), on='country_iso3_code', how='left')
 
     # Cluster composition
-    cluster_composition = df.groupby(['country_iso3_code', 'product_space_cluster_name']).size().unstack(fill_value=0)
+    cluster_composition = df.groupby(['country_iso3_code', 'product_space_cluster_name'], observed=True).size().unstack(fill_value=0)
+    cluster_composition.columns = cluster_composition.columns.astype(str)
     cluster_composition = cluster_composition.div(cluster_composition.sum(axis=1), axis=0)
     country_summary = country_summary.merge(cluster_composition, on='country_iso3_code', how='left')
 
-    country_summary.to_csv("outputs/country_summary.csv", index=False)
-    logging.info("Country summaries saved to outputs/country_summary.csv")
+    path = write_table(country_summary, f"{config['output_dir']}/country_summary", config['output_format'])
+    logging.info(f"Country summaries saved to {path}")
 
     logging.info("Step 8 completed.")
+    return {'country_summary': country_summary}
 
 
-    # --- 9) Validation and sensitivity ---
+# --- 9) Validation and sensitivity ---
+def sensitivity_stage(config, df):
     logging.info("Step 9: Performing validation and sensitivity analysis...")
+    from sensitivity import candidate_counts, top_n_overlap
 
     # Coverage and missingness summaries; distance bounds check (already done in Step 1)
     logging.info("Validation: Coverage and distance bounds already checked in Step 1.")
 
-    # RCA threshold sweep
+    # RCA threshold sweep: density medians once, thresholds broadcast over all rows
     logging.info("Sensitivity: Performing RCA threshold sweep...")
-    rca_thresholds = [0.75, 1.0, 1.25]
-    opportunity_counts = {}
-    for threshold in rca_thresholds:
-        temp_df = add_rca_binary(df.copy(), threshold=threshold)
-        temp_df['is_candidate'] = (
-            (temp_df['density'] >= temp_df.groupby('country_iso3_code')['density'].transform('median')) &
-            (temp_df['export_rca'] < threshold)
-        )
-        opportunity_counts[threshold] = temp_df[temp_df['is_candidate']].groupby('country_iso3_code').size()
-    
-    logging.info(f"Opportunity counts for different RCA thresholds: {opportunity_counts}")
-
-    # Optional trailing average (3-year) for export_rca and density
-    if config['smoothing_years'] == 3:
-        logging.info("Applying 3-year trailing average for export_rca and density...")
-        # This would require loading data for multiple years, which is not currently implemented in the pipeline.
-        # For now, this will be a placeholder.
-        logging.info("Trailing average not implemented in current pipeline due to single-year data loading.")
+    rca_thresholds = config.get('sensitivity_thresholds', [0.75, 1.0, 1.25])
+    opportunity_counts = candidate_counts(df, rca_thresholds)
+    logging.info(f"Opportunity counts for different RCA thresholds (all countries): {opportunity_counts.sum().to_dict()}")
+    outputs = {'opportunity_counts': opportunity_counts}
+
+    if config.get('sensitivity_top_n'):
+        opportunity_overlap = top_n_overlap(df, rca_thresholds, reference=config['rca_threshold'], top_n=config['sensitivity_top_n'])
+        logging.info(f"Share of top-{config['sensitivity_top_n']} opportunities kept vs rca_threshold={config['rca_threshold']} (mean): {opportunity_overlap.mean().round(3).to_dict()}")
+        outputs['opportunity_overlap'] = opportunity_overlap
+
+    if config['smoothing_years'] > 1:
+        logging.info(f"Sensitivity: export_rca, density and export_value use a {config['smoothing_years']}-year trailing average (Step 1b).")
 
     # Log config, library versions, and random_seed (already done in Step 0)
     logging.info("Validation: Config, library versions, and random_seed already logged in Step 0.")
 
     logging.info("Step 9 completed.")
+    return outputs
+
+
+def _peer_group_files(config):
+    # A peer_group CSV is an input of the presence stage; 'global' and 'knn' read no file
+    peer_group = config.get('peer_group', 'global')
+    return [] if peer_group in ('global', 'knn') else [peer_group]
+
+def _complexity_writes(config):
+    if config.get('complexity', 'atlas') != 'recompute':
+        return []
+    return ['{output_dir}/complexity_country.{output_format}', '{output_dir}/complexity_product.{output_format}']
+
+STAGES = [
+    Stage('dimensions', dimensions_stage, files=[PRODUCT_META_PATH, LAYOUT_PATH, EDGES_PATH, COUNTRY_YEAR_PATH]),
+    Stage('load', load_stage, deps=['dimensions'], files=[COUNTRY_PRODUCT_PATH], config_keys=['year']),
+    Stage('smoothing', smoothing_stage, deps=['load'],
+          files=[COUNTRY_PRODUCT_PATH], config_keys=['year', 'smoothing_years']),
+    Stage('presence', presence_stage, deps=['smoothing'], files=_peer_group_files, config_keys=['rca_threshold', 'peer_group', 'peer_k']),
+    Stage('fit', fit_stage, deps=['presence'], config_keys=['year', 'rca_threshold', 'fit_recompute']),
+    Stage('complexity', complexity_stage, deps=['dimensions', 'load', 'fit'],
+          config_keys=['year', 'rca_threshold', 'complexity', 'exclude_natural_resources', 'output_format'], writes=_complexity_writes),
+    # Runs every time; the render manifest skips countries whose figures are unchanged and present
+    Stage('visualization', visualization_stage, deps=['dimensions', 'fit'],
+          config_keys=['render_workers', 'shared_plotlyjs', 'incremental_render', 'presence_metric'], always_run=True),
+    Stage('ranking', ranking_stage, deps=['dimensions', 'fit', 'complexity'], config_keys=['rca_threshold', 'presence_metric', 'exclude_natural_resources', 'top_n_opportunities', 'output_format'],
+          writes=['{output_dir}/top_opportunities.{output_format}']),
+    Stage('similarity', similarity_stage, deps=['dimensions', 'fit'],
+          config_keys=['exclude_natural_resources', 'similarity_metric', 'similarity_top_k', 'similarity_dense', 'output_format'],
+          writes=['{output_dir}/similarity_index.npz']),
+    Stage('summary', summary_stage, deps=['dimensions', 'load', 'complexity', 'ranking'], config_keys=['year', 'rca_threshold', 'top_n_strengths', 'output_format'],
+          writes=['{output_dir}/country_summary.{output_format}']),
+    Stage('sensitivity', sensitivity_stage, deps=['ranking'],
+          config_keys=['rca_threshold', 'smoothing_years', 'sensitivity_thresholds', 'sensitivity_top_n']),
+]
+# Stages fanned out per year in multi-year runs; figures and the sensitivity sweep stay single-year
+YEAR_STAGES = [stage for stage in STAGES if stage.name not in ('dimensions', 'visualization', 'sensitivity')]
+
+def parse_years(years) -> list[int]:
+    """Years from a single year, an inclusive 'start..end' range (e.g. '1995..2023') or a list of either.
+
+    YAML reads `years: [1995..2023]` as a list holding one range string, so list items are expanded too.
+    """
+    if isinstance(years, str) and '..' in years:
+        start, end = (int(year) for year in years.split('..'))
+        if start > end:
+            raise ValueError(f"Year range {years!r} is reversed; expected start..end with start <= end")
+        return list(range(start, end + 1))
+    if isinstance(years, (list, tuple)):
+        return sorted({year for item in years for year in parse_years(item)})
+    return [int(years)]
+
+def _stage_cache_dir(config):
+    return os.path.join(config['output_dir'], STAGE_CACHE_DIR) if config.get('stage_cache', True) else None
+
+_year_upstream = {}
+
+def _init_year_worker(upstream):
+    _year_upstream.update(upstream)
+
+def _run_year(config, year: int, force: tuple[str, ...], cprofile_stages: tuple[str, ...]) -> tuple[pd.DataFrame, list[dict]]:
+    # One year's stages under <output_dir>/year=<year>/, with that partition's own stage cache
+    output_dir = os.path.join(config['output_dir'], f'year={year}')
+    config = {**config, 'year': year, 'output_dir': output_dir}
+    cache_dir = _stage_cache_dir(config)
+    profiler = StageProfiler(trace_memory=config.get('profile_memory', False), cprofile_stages=cprofile_stages, output_dir=output_dir)
+    logging.info(f"Year {year}: running {', '.join(stage.name for stage in YEAR_STAGES)}...")
+    artifacts = run_stages(YEAR_STAGES, config, cache_dir=cache_dir, force=force, collect=('top_opportunities',),
+                           profiler=profiler, upstream=_year_upstream)
+    return artifacts['top_opportunities'], [{'year': year, **record} for record in profiler.records]
+
+def run_years(config, years: list[int], force: tuple[str, ...] = (), profiler: StageProfiler | None = None) -> pd.DataFrame:
+    """Runs YEAR_STAGES for every year in `years` and returns the concatenated top opportunities.
+
+    The dimension tables are loaded (or read from the stage cache) once and sent once to each of
+    `year_workers` processes (0 = all cores). Each year writes its tables to
+    `<output_dir>/year=<year>/`; the opportunities panel, with a year column, goes to
+    `<output_dir>/opportunities_panel`.
+    """
+    from io_load import build_country_product_cache, concat_aligned
+
+    names = [stage.name for stage in STAGES]
+    unknown = set(force) - set(names) - {'all'}
+    if unknown:
+        raise ValueError(f"Unknown stages to force: {sorted(unknown)}; expected one of {names}")
+    # Workers read the year partitions; building them here keeps them from racing on the CSV
+    if config.get('data_cache', True):
+        build_country_product_cache(COUNTRY_PRODUCT_PATH)
+
+    dimensions = STAGES[0]
+    tables = run_stages([dimensions], config, cache_dir=_stage_cache_dir(config), force=tuple(set(force) & {'all', dimensions.name}),
+                        collect=DIMENSION_TABLES, profiler=profiler)
+    upstream = {dimensions.name: (stage_key(dimensions, config, []), tables)}
+    year_force = tuple(set(force) & ({'all', dimensions.name} | {stage.name for stage in YEAR_STAGES}))
+    cprofile_stages = tuple(profiler.cprofile_stages) if profiler else ()
+
+    workers = config.get('year_workers', 1) or os.cpu_count()
+    if workers <= 1 or len(years) == 1:
+        _init_year_worker(upstream)
+        results = [_run_year(config, year, year_force, cprofile_stages) for year in years]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(years)), initializer=_init_year_worker, initargs=(upstream,)) as executor:
+            futures = [executor.submit(_run_year, config, year, year_force, cprofile_stages) for year in years]
+            results = [future.result() for future in futures]
+
+    frames = []
+    for year, (top_opportunities, records) in zip(years, results):
+        top_opportunities.insert(0, 'year', np.uint16(year))
+        frames.append(top_opportunities)
+        if profiler:
+            profiler.records.extend(records)
+    opportunities_panel = concat_aligned(frames)
+    path = write_table(opportunities_panel, f"{config['output_dir']}/opportunities_panel", config['output_format'])
+    logging.info(f"Opportunities panel for {len(years)} years saved to {path}")
+    return opportunities_panel
+
+
+def main(config_path: str = 'config.yaml', force: tuple[str, ...] = (), cprofile: tuple[str, ...] = (), years=None):
+    """
+    Main function to run the data processing pipeline.
+    """
+    logging.info("Starting the pipeline...")
+
+    # Load configuration
+    with open(config_path, 'r') as f:
+        config = yaml.safe_load(f)
+    config.setdefault('output_format', 'parquet')
+    config.setdefault('output_dir', OUTPUT_DIR)
+    if years is not None:
+        config['years'] = years
+    logging.info(f"Configuration loaded: {config}")
+
+    # Set random seed
+    np.random.seed(config['random_seed'])
+    logging.info(f"Random seed set to {config['random_seed']}")
+
+    # Persist a config snapshot to output_dir
+    os.makedirs(config['output_dir'], exist_ok=True)
+    snapshot_path = os.path.join(config['output_dir'], CONFIG_SNAPSHOT)
+    with open(snapshot_path, 'w') as f:
+        yaml.dump(config, f)
+    logging.info(f"Configuration snapshot saved to {snapshot_path}")
+
+    # Stages only rerun when their code, data files, config keys or upstream stages changed
+    cache_dir = _stage_cache_dir(config)
+    profiler = StageProfiler(trace_memory=config.get('profile_memory', False),
+                             cprofile_stages=tuple(config.get('cprofile_stages') or ()) + tuple(cprofile), output_dir=config['output_dir'])
+    profile_path = os.path.join(config['output_dir'], RUN_PROFILE)
+    years = parse_years(config['years']) if config.get('years') else None
+    try:
+        if years:
+            run_years(config, years, force=force, profiler=profiler)
+        else:
+            run_stages(STAGES, config, cache_dir=cache_dir, force=force, profiler=profiler)
+    finally:
+        # Written even when a stage fails, so the profile shows how far the run got
+        profiler.write(profile_path, config_path=config_path, year=config.get('year'), years=years, force=list(force))
+        logging.info(f"Run profile saved to {profile_path}")
     logging.info("Pipeline finished.")
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the Atlas HS92 country-product pipeline.")
+    parser.add_argument('--config', default='config.yaml', help="Path to the YAML config.")
+    parser.add_argument('--force', action='append', default=[], metavar='STAGE',
+                        help=f"Recompute STAGE and everything downstream of it (repeatable; 'all' for every stage). Stages: {', '.join(stage.name for stage in STAGES)}.")
+    parser.add_argument('--cprofile', action='append', default=[], metavar='STAGE',
+                        help="Run STAGE under cProfile and dump its stats to <output_dir>/profile_STAGE.prof (repeatable).")
+    parser.add_argument('--years', metavar='START..END',
+                        help="Run every year in the range (or a comma-separated list) instead of the config's year; overrides `years` in the config.")
+    return parser.parse_args()
+
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    args = parse_args()
+    years = args.years.split(',') if args.years and '..' not in args.years else args.years
+    main(args.config, force=tuple(args.force), cprofile=tuple(args.cprofile), years=years)
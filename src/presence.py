@@ -1,14 +1,125 @@
 import pandas as pd
+import numpy as np
+from scipy import sparse
 
-def add_rca_binary(df: pd.DataFrame, threshold: float = 1.0) -> pd.DataFrame:
-    temp = df.copy()
-    temp["binary_specialization"] = (temp["export_rca"] >= threshold).astype(int)
-    return temp
-
-def add_peer_relative_presence(df: pd.DataFrame, eps: float = 1e-12) -> pd.DataFrame:
-    temp = df.copy()
-    temp["share"] = temp["export_value"] / temp.groupby("country_iso3_code")["export_value"].transform("sum")
-    peer_share = temp.groupby("product_hs92_code")["share"].transform("mean")
-    temp["rel_presence"] = temp["share"] / (peer_share + eps)
-    temp["abs_presence"] = temp["share"] - peer_share
-    return temp
+PRESENCE_MODES = ("copy", "inplace", "arrays")
+
+def _emit(df: pd.DataFrame, columns: dict[str, np.ndarray], mode: str):
+    """Returns a copy with the new columns, writes them into `df`, or returns just the arrays."""
+    if mode not in PRESENCE_MODES:
+        raise ValueError(f"mode must be one of {PRESENCE_MODES}, got {mode!r}")
+    if mode == "arrays":
+        return columns
+    target = df.copy() if mode == "copy" else df
+    for name, values in columns.items():
+        target[name] = values
+    return target
+
+def add_rca_binary(data, threshold: float = 1.0, mode: str = "copy"):
+    """Flags RCA specialization on the long frame (`binary_specialization`) or on a CountryProductPanel (`panel.binary`).
+
+    For frames, mode="copy" keeps the original int column on a copy; "inplace" writes a uint8
+    column into `data` and "arrays" returns {"binary_specialization": uint8 array} without touching it.
+    """
+    from panel import CountryProductPanel
+
+    if isinstance(data, CountryProductPanel):
+        data.binary = np.greater_equal(data.export_rca, threshold, out=data.empty(dtype=np.uint8))
+        return data
+
+    binary = (data["export_rca"].to_numpy() >= threshold)
+    return _emit(data, {"binary_specialization": binary.astype(int if mode == "copy" else np.uint8)}, mode)
+
+def peer_groups(countries: pd.Index, labels: pd.Series | None = None) -> tuple[sparse.csr_matrix, np.ndarray]:
+    """Sparse (groups × countries) indicator and each country's group row from a country → label mapping.
+
+    Countries without a label (or every country, when `labels` is None) are compared with a
+    global group holding all countries.
+    """
+    labels = pd.Series(dtype=object) if labels is None else labels
+    codes, groups = pd.factorize(pd.Series(countries).map(labels), sort=True)
+    global_row = len(groups)
+    assignment = np.where(codes >= 0, codes, global_row)
+
+    rows = np.r_[codes[codes >= 0], np.full(len(countries), global_row)]
+    cols = np.r_[np.flatnonzero(codes >= 0), np.arange(len(countries))]
+    indicator = sparse.csr_matrix((np.ones(len(rows), dtype=np.float32), (rows, cols)), shape=(global_row + 1, len(countries)))
+    return indicator, assignment
+
+def nearest_peer_groups(similarity: pd.DataFrame, countries: pd.Index, k: int = 10) -> tuple[sparse.csr_matrix, np.ndarray]:
+    """One peer group per country holding its k most similar other countries (e.g. from country_similarity_cosine)."""
+    scores = similarity.reindex(index=countries, columns=countries).to_numpy(dtype=np.float64, copy=True)
+    np.fill_diagonal(scores, -np.inf)
+    k = min(k, len(countries) - 1)
+    nearest = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    rows = np.repeat(np.arange(len(countries)), k)
+    indicator = sparse.csr_matrix((np.ones(rows.size, dtype=np.float32), (rows, nearest.ravel())), shape=(len(countries), len(countries)))
+    return indicator, np.arange(len(countries))
+
+def peer_relative_matrices(export_value: np.ndarray, indicator: sparse.csr_matrix, assignment: np.ndarray, eps: float = 1e-12,
+                           out: dict[str, np.ndarray] | None = None) -> dict[str, np.ndarray]:
+    """Share, rel_presence and abs_presence country × product matrices against each country's peer group.
+
+    Rows of export values are normalized to shares, and the mean share of every peer group is
+    computed at once as (groups × countries) @ (countries × products) / group sizes. Results are
+    written into zero-filled float32 arrays from `out` when given (e.g. memmaps from panel.empty).
+    """
+    if out is None:
+        out = {name: np.zeros(export_value.shape, dtype=np.float32) for name in ("share", "rel_presence", "abs_presence")}
+    totals = export_value.sum(axis=1, dtype=np.float64)[:, None]
+    share = out["share"]
+    np.divide(export_value, totals, out=share, where=totals > 0)
+
+    sizes = np.asarray(indicator.sum(axis=1), dtype=np.float32)
+    peer_share = np.asarray(indicator @ share) / np.maximum(sizes, 1)
+    peer_share = peer_share[assignment].astype(np.float32)
+    np.subtract(share, peer_share, out=out["abs_presence"])
+    peer_share += np.float32(eps)
+    np.divide(share, peer_share, out=out["rel_presence"])
+    return out
+
+def add_peer_relative_presence(data, eps: float = 1e-12, mode: str = "copy", peers: tuple[sparse.csr_matrix, np.ndarray] | None = None):
+    """Adds `share`, `rel_presence` and `abs_presence` against the mean share per product of a peer set.
+
+    For a CountryProductPanel the matrices are filled on the panel against `peers` (from
+    peer_groups / nearest_peer_groups; global when None), with missing pairs counted as zero
+    exports. For the long frame the peer set is global; shares come from bincounts over
+    factorized keys and "inplace" / "arrays" modes emit float32 columns without copying the frame.
+    """
+    from panel import CountryProductPanel
+
+    if isinstance(data, CountryProductPanel):
+        indicator, assignment = peers if peers is not None else peer_groups(data.countries)
+        out = {name: data.empty() for name in ("share", "rel_presence", "abs_presence")}
+        for name, matrix in peer_relative_matrices(data.export_value, indicator, assignment, eps, out=out).items():
+            setattr(data, name, matrix)
+        return data
+
+    df = data
+    export_value = df["export_value"].to_numpy(dtype=np.float64)
+    countries, _ = pd.factorize(df["country_iso3_code"])
+    products, _ = pd.factorize(df["product_hs92_code"])
+
+    has_country, has_product = countries >= 0, products >= 0
+    country_total = np.bincount(countries[has_country], weights=export_value[has_country])
+    share = np.full(len(df), np.nan)
+    peer_share = np.full(len(df), np.nan)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        share[has_country] = export_value[has_country] / country_total[countries[has_country]]
+
+        # Mean share per product over rows with a share, like groupby(...).transform("mean")
+        valid = has_product & ~np.isnan(share)
+        n_products = products.max() + 1 if len(products) else 0
+        product_mean = (
+            np.bincount(products[valid], weights=share[valid], minlength=n_products)
+            / np.bincount(products[valid], minlength=n_products)
+        )
+    peer_share[has_product] = product_mean[products[has_product]]
+
+    dtype = np.float64 if mode == "copy" else np.float32
+    columns = {
+        "share": share.astype(dtype),
+        "rel_presence": (share / (peer_share + eps)).astype(dtype),
+        "abs_presence": (share - peer_share).astype(dtype),
+    }
+    return _emit(df, columns, mode)
@@ -0,0 +1,102 @@
+import pandas as pd
+import numpy as np
+import os
+import sys
+import json
+import time
+import cProfile
+import tracemalloc
+from contextlib import contextmanager
+from typing import Iterator
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+def _max_rss_mb() -> float | None:
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 1024**2
+
+def artifact_shape(value) -> list[int] | None:
+    """Row and column counts of a frame, panel, dimension table or array (None for anything else)."""
+    from panel import CountryProductPanel
+    from dimensions import Dimension
+
+    if isinstance(value, (pd.DataFrame, np.ndarray)) and value.ndim == 2:
+        return list(value.shape)
+    if isinstance(value, (pd.Series, np.ndarray)):
+        return [len(value), 1]
+    if isinstance(value, CountryProductPanel):
+        return list(value.shape)
+    if isinstance(value, Dimension):
+        return list(value.table.shape)
+    return None
+
+class StageProfiler:
+    """Records wall/CPU time, memory peaks and artifact shapes for each pipeline stage.
+
+    Peak RSS is the process high-water mark after the stage. `trace_memory` also records the
+    stage's own peak of Python/numpy allocations via tracemalloc, at some runtime cost. Stages
+    named in `cprofile_stages` are run under cProfile and dumped to `<output_dir>/profile_<stage>.prof`.
+    """
+
+    def __init__(self, trace_memory: bool = False, cprofile_stages: tuple[str, ...] = (), output_dir: str = 'outputs'):
+        self.trace_memory = trace_memory
+        self.cprofile_stages = set(cprofile_stages)
+        self.output_dir = output_dir
+        self.records: list[dict] = []
+        self.started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str, inputs: dict | None = None) -> Iterator[dict]:
+        """Times the enclosed block; callers may add fields (e.g. 'outputs', 'cached') to the yielded record."""
+        record = {'stage': name}
+        if inputs is not None:
+            record['inputs'] = {key: artifact_shape(value) for key, value in inputs.items()}
+        profiler = cProfile.Profile() if name in self.cprofile_stages else None
+        tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        elif self.trace_memory:
+            tracemalloc.reset_peak()
+
+        wall, cpu = time.perf_counter(), time.process_time()
+        if profiler:
+            profiler.enable()
+        try:
+            yield record
+        finally:
+            if profiler:
+                profiler.disable()
+            record['wall_s'] = round(time.perf_counter() - wall, 4)
+            record['cpu_s'] = round(time.process_time() - cpu, 4)
+            if self.trace_memory:
+                record['peak_traced_mb'] = round(tracemalloc.get_traced_memory()[1] / 1024**2, 2)
+                if tracing:
+                    tracemalloc.stop()
+            record['max_rss_mb'] = _max_rss_mb()
+            if profiler:
+                os.makedirs(self.output_dir, exist_ok=True)
+                record['cprofile'] = os.path.join(self.output_dir, f'profile_{name}.prof')
+                profiler.dump_stats(record['cprofile'])
+            self.records.append(record)
+
+    def write(self, path: str, **metadata) -> None:
+        """Writes the stage records (and any run metadata) as JSON.
+
+        `total_wall_s` is the elapsed time since the profiler was created; `summed_stage_wall_s`
+        adds up the stage records, which exceeds it when stages ran in parallel workers.
+        """
+        payload = {
+            **metadata,
+            'total_wall_s': round(time.perf_counter() - self.started, 4),
+            'summed_stage_wall_s': round(sum(r['wall_s'] for r in self.records), 4),
+            'stages': self.records,
+        }
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(payload, f, indent=2, default=str)
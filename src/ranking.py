@@ -0,0 +1,38 @@
+import pandas as pd
+import numpy as np
+
+def top_k_positions(groups: pd.Series, scores: pd.Series, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """Positions of the top-k rows per group and their group codes, grouped in sorted key order."""
+    codes, _ = pd.factorize(groups, sort=True)
+    values = scores.to_numpy(dtype=np.float64, na_value=np.nan)
+    candidates = np.flatnonzero((codes >= 0) & ~np.isnan(values))
+
+    # Sort by group, then score descending; position breaks ties like nlargest(keep='first')
+    order = candidates[np.lexsort((candidates, -values[candidates], codes[candidates]))]
+    sorted_codes = codes[order]
+    starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+    rank = np.arange(len(order)) - np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+    keep = rank < k
+    return order[keep], sorted_codes[keep]
+
+def top_k_per_group(df: pd.DataFrame, group_col: str, score_col: str, k: int = 10) -> pd.DataFrame:
+    """Equivalent of groupby(group_col).apply(lambda x: x.nlargest(k, score_col)).reset_index(drop=True).
+
+    Ties always keep row order (nlargest's keep='first'). Once k reaches the group size nlargest
+    falls back to an unstable sort and keeps missing scores last; here missing scores are never ranked.
+    """
+    positions, _ = top_k_positions(df[group_col], df[score_col], k)
+    return df.iloc[positions].reset_index(drop=True)
+
+def top_k_with_names(df: pd.DataFrame, group_col: str, score_col: str, k: int = 10,
+                     name_col: str = "product_name", sep: str = "; ") -> tuple[pd.DataFrame, pd.Series]:
+    """Returns the top-k frame and, per group, the top-k names joined in rank order."""
+    positions, codes = top_k_positions(df[group_col], df[score_col], k)
+    top = df.iloc[positions].reset_index(drop=True)
+
+    # Top-k rows are contiguous per group, so names split on the group boundaries
+    boundaries = np.flatnonzero(codes[1:] != codes[:-1]) + 1
+    names = top[name_col].to_numpy(dtype=object, na_value="").astype(str)
+    joined = [sep.join(chunk) for chunk in np.split(names, boundaries)] if len(names) else []
+    keys = top[group_col].to_numpy()[np.r_[0, boundaries]] if len(names) else []
+    return top, pd.Series(joined, index=pd.Index(keys, name=group_col), name=name_col)
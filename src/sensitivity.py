@@ -0,0 +1,42 @@
+import pandas as pd
+import numpy as np
+from scipy import sparse
+
+from ranking import top_k_positions
+
+def _threshold_labels(thresholds: np.ndarray) -> list[str]:
+    return [f"rca_{threshold:g}" for threshold in thresholds]
+
+def _candidate_masks(df: pd.DataFrame, thresholds) -> tuple[np.ndarray, pd.Index, np.ndarray, np.ndarray]:
+    """Country codes and a (rows × thresholds) candidate mask; density medians are computed once."""
+    thresholds = np.asarray(thresholds, dtype=np.float32)
+    codes, countries = pd.factorize(df["country_iso3_code"], sort=True)
+    density = df["density"].to_numpy(dtype=np.float32)
+    high_fit = density >= df.groupby(codes)["density"].median().to_numpy(dtype=np.float32)[codes]
+    mask = high_fit[:, None] & (df["export_rca"].to_numpy(dtype=np.float32)[:, None] < thresholds[None, :])
+    return codes, pd.Index(countries, name="country_iso3_code"), thresholds, mask
+
+def candidate_counts(df: pd.DataFrame, thresholds) -> pd.DataFrame:
+    """Country × threshold matrix of opportunity candidates (high fit, export_rca below the threshold)."""
+    codes, countries, thresholds, mask = _candidate_masks(df, thresholds)
+    indicator = sparse.csr_matrix((np.ones(len(codes), dtype=np.int32), (codes, np.arange(len(codes)))), shape=(len(countries), len(codes)))
+    counts = indicator @ mask.astype(np.int32)
+    return pd.DataFrame(counts, index=countries, columns=_threshold_labels(thresholds))
+
+def top_n_overlap(df: pd.DataFrame, thresholds, reference: float, top_n: int = 10, score_col: str = "score") -> pd.DataFrame:
+    """Country × threshold share of the reference threshold's top-N opportunities still in the top-N list."""
+    codes, countries, thresholds, mask = _candidate_masks(df, np.append(thresholds, reference))
+    groups = pd.Series(codes)
+    scores = df[score_col].reset_index(drop=True)
+
+    # Non-candidates are masked to NA so they fall out of the ranking; positions map back to country codes
+    reference_top, _ = top_k_positions(groups.where(mask[:, -1]), scores, top_n)
+    reference_size = np.bincount(codes[reference_top], minlength=len(countries))
+    overlap = np.zeros((len(countries), len(thresholds) - 1))
+    for t in range(len(thresholds) - 1):
+        top, _ = top_k_positions(groups.where(mask[:, t]), scores, top_n)
+        retained = top[np.isin(top, reference_top)]
+        overlap[:, t] = np.bincount(codes[retained], minlength=len(countries))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        overlap = overlap / reference_size[:, None]
+    return pd.DataFrame(overlap, index=countries, columns=_threshold_labels(thresholds[:-1]))
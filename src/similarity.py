@@ -1,21 +1,103 @@
 import pandas as pd
 import numpy as np
+from dataclasses import dataclass
 from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.metrics import jaccard_score
 
-def country_similarity_cosine(df: pd.DataFrame) -> pd.DataFrame:
-    """Calculates cosine similarity between countries based on RCA vectors."""
-    rca_matrix = df.pivot(index="country_iso3_code", columns="product_hs92_code", values="export_rca").fillna(0)
+def _country_matrix(data, values: str, panel_attr: str) -> pd.DataFrame:
+    from panel import CountryProductPanel
+
+    if isinstance(data, CountryProductPanel):
+        return data.frame(getattr(data, panel_attr))
+    return data.pivot(index="country_iso3_code", columns="product_hs92_code", values=values).fillna(0)
+
+def country_similarity_cosine(data) -> pd.DataFrame:
+    """Calculates cosine similarity between countries based on RCA vectors (long frame or CountryProductPanel)."""
+    rca_matrix = _country_matrix(data, "export_rca", "export_rca")
     similarity_matrix = cosine_similarity(rca_matrix)
     similarity_df = pd.DataFrame(similarity_matrix, index=rca_matrix.index, columns=rca_matrix.index)
     return similarity_df
 
-def country_similarity_jaccard(df: pd.DataFrame) -> pd.DataFrame:
-    """Calculates Jaccard similarity between countries based on binary specialization."""
-    binary_matrix = df.pivot(index="country_iso3_code", columns="product_hs92_code", values="x_binary").fillna(0)
-    similarity_matrix = np.zeros((binary_matrix.shape[0], binary_matrix.shape[0]))
-    for i in range(binary_matrix.shape[0]):
-        for j in range(binary_matrix.shape[0]):
-            similarity_matrix[i, j] = jaccard_score(binary_matrix.iloc[i], binary_matrix.iloc[j])
+def _popcount_intersection(packed: np.ndarray) -> np.ndarray:
+    # Rows are bit-packed into uint64 words; intersections are popcounts of pairwise ANDs
+    intersection = np.zeros((packed.shape[0], packed.shape[0]), dtype=np.int64)
+    for word in range(packed.shape[1]):
+        intersection += np.bitwise_count(packed[:, None, word] & packed[None, :, word])
+    return intersection
+
+def jaccard_matrix(binary: np.ndarray, packed: bool = False) -> np.ndarray:
+    """Pairwise Jaccard similarity of the rows of a 0/1 matrix.
+
+    The intersection is a matrix product (or a popcount over bit-packed uint64 rows with
+    `packed=True`) and the union comes from row sums. Rows with an empty union score 0,
+    matching `jaccard_score(..., zero_division=0)`.
+    """
+    binary = np.asarray(binary) != 0
+    if packed:
+        # Viewing bytes as uint64 words needs C-contiguous rows (pivoted frames are F-ordered)
+        bits = np.packbits(np.ascontiguousarray(binary), axis=1)
+        bits = np.pad(bits, ((0, 0), (0, -bits.shape[1] % 8)))
+        intersection = _popcount_intersection(np.ascontiguousarray(bits).view(np.uint64))
+    else:
+        as_float = binary.astype(np.float32)
+        intersection = np.rint(as_float @ as_float.T).astype(np.int64)
+    sizes = binary.sum(axis=1)
+    union = sizes[:, None] + sizes[None, :] - intersection
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(union > 0, intersection / union, 0.0)
+
+def country_similarity_jaccard(data, packed: bool = False) -> pd.DataFrame:
+    """Calculates Jaccard similarity between countries based on binary specialization (long frame or CountryProductPanel)."""
+    binary_matrix = _country_matrix(data, "x_binary", "binary")
+    similarity_matrix = jaccard_matrix(binary_matrix.to_numpy(), packed=packed)
     similarity_df = pd.DataFrame(similarity_matrix, index=binary_matrix.index, columns=binary_matrix.index)
     return similarity_df
+
+@dataclass
+class SimilarityIndex:
+    """Top-k most similar countries per country: neighbour positions (int32) and cosine scores (float32)."""
+    countries: pd.Index
+    neighbors: np.ndarray
+    scores: np.ndarray
+
+    def nearest(self, country: str, k: int | None = None) -> pd.Series:
+        """The k most similar countries to `country`, best first."""
+        row = self.countries.get_loc(country)
+        k = self.neighbors.shape[1] if k is None else min(k, self.neighbors.shape[1])
+        return pd.Series(self.scores[row, :k], index=self.countries[self.neighbors[row, :k]], name=country)
+
+    def save(self, path: str) -> None:
+        np.savez_compressed(path, countries=self.countries.to_numpy(dtype=str), neighbors=self.neighbors, scores=self.scores)
+
+def load_similarity_index(path: str) -> SimilarityIndex:
+    with np.load(path) as data:
+        return SimilarityIndex(pd.Index(data["countries"], name="country_iso3_code"), data["neighbors"], data["scores"])
+
+def build_similarity_index(data, k: int = 20, block_size: int = 1024) -> SimilarityIndex:
+    """Builds a top-k cosine index on L2-normalized float32 RCA vectors (long frame or CountryProductPanel).
+
+    The all-pairs product is computed `block_size` rows at a time, so memory stays at
+    block_size × countries instead of the full dense matrix. Norms are applied to each block of
+    dot products, so panel matrices (including memmaps) are read in place rather than copied.
+    A country is never its own neighbour.
+    """
+    rca_matrix = _country_matrix(data, "export_rca", "export_rca")
+    vectors = rca_matrix.to_numpy(dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1)
+    inverse = np.divide(1, norms, out=np.zeros_like(norms), where=norms > 0)
+
+    n = len(vectors)
+    k = min(k, n - 1)
+    neighbors = np.empty((n, k), dtype=np.int32)
+    scores = np.empty((n, k), dtype=np.float32)
+    for start in range(0, n, block_size):
+        stop = min(start + block_size, n)
+        block = vectors[start:stop] @ vectors.T
+        block *= inverse[start:stop, None]
+        block *= inverse[None, :]
+        block[np.arange(stop - start), np.arange(start, stop)] = -np.inf
+        top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(block, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind="stable")
+        neighbors[start:stop] = np.take_along_axis(top, order, axis=1)
+        scores[start:stop] = np.take_along_axis(top_scores, order, axis=1)
+    return SimilarityIndex(pd.Index(rca_matrix.index, name="country_iso3_code"), neighbors, scores)
@@ -0,0 +1,92 @@
+import pandas as pd
+import numpy as np
+import logging
+
+from io_load import iter_country_product, available_years
+from panel import allocate_matrix
+
+# density = clip(1 - distance, 0, 1) is linear on the asserted [0, 1] range, so smoothing
+# distance before Step 3 gives the trailing mean of density.
+SMOOTHED_COLUMNS = ['export_rca', 'distance', 'export_value']
+
+class TrailingWindow:
+    """Trailing N-year means over dense (year × country × product) arrays with running sums.
+
+    Each push overwrites the oldest slot of a ring buffer and updates the sums and counts in
+    O(countries × products), so older years are never recomputed. With `work_dir` the buffers are
+    memory-mapped there, and each year's slot is a view paged in on access. Values are kept as
+    `dtype` (float64 by default, since float32 rounds export values above 2**24).
+    """
+
+    def __init__(self, countries: pd.Index, products: pd.Index, columns: list[str], window: int, work_dir: str | None = None,
+                 dtype=np.float64):
+        self.countries = pd.Index(countries)
+        self.products = pd.Index(products)
+        self.columns = list(columns)
+        self.window = window
+        shape = (len(self.columns), len(self.countries), len(self.products))
+        self.values = allocate_matrix((window,) + shape, dtype, work_dir)
+        self.observed = allocate_matrix((window,) + shape[1:], bool, work_dir)
+        self.sums = allocate_matrix(shape, np.float64, work_dir)
+        self.counts = allocate_matrix(shape[1:], np.uint16, work_dir)
+        self.years = [None] * window
+        self.pushed = 0
+
+    def _positions(self, df: pd.DataFrame) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        rows = self.countries.get_indexer(df['country_iso3_code'])
+        cols = self.products.get_indexer(df['product_hs92_code'])
+        valid = (rows >= 0) & (cols >= 0) & df['product_hs92_code'].notna().to_numpy()
+        return rows[valid], cols[valid], valid
+
+    def push(self, year: int, df: pd.DataFrame) -> None:
+        """Adds one year's long frame, evicting the oldest year once the window is full."""
+        slot = self.pushed % self.window
+        if self.years[slot] is not None:
+            self.sums -= np.where(self.observed[slot], self.values[slot], 0)
+            self.counts -= self.observed[slot]
+
+        rows, cols, valid = self._positions(df)
+        self.values[slot] = 0
+        self.observed[slot] = False
+        for k, column in enumerate(self.columns):
+            self.values[slot, k, rows, cols] = df[column].to_numpy(dtype=self.values.dtype)[valid]
+        self.observed[slot, rows, cols] = True
+
+        self.sums += np.where(self.observed[slot], self.values[slot], 0)
+        self.counts += self.observed[slot]
+        self.years[slot] = year
+        self.pushed += 1
+
+    def mean(self) -> np.ndarray:
+        """Returns (column × country × product) trailing means, NaN where a pair was never observed."""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.sums / self.counts
+
+    def assign(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Overwrites the window columns of a long frame with their trailing means, keeping dtypes."""
+        rows, cols, valid = self._positions(df)
+        means = self.mean()
+        for k, column in enumerate(self.columns):
+            smoothed = df[column].to_numpy(dtype=np.float64, copy=True)
+            smoothed[valid] = means[k, rows, cols]
+            if np.issubdtype(df[column].dtype, np.integer):
+                smoothed = np.rint(smoothed)
+            df[column] = smoothed.astype(df[column].dtype)
+        return df
+
+def smooth_trailing(df: pd.DataFrame, year: int, window: int, columns: list[str] = SMOOTHED_COLUMNS, work_dir: str | None = None, **load_kwargs) -> pd.DataFrame:
+    """Replaces columns of the target-year frame with trailing `window`-year means per (country, product).
+
+    Earlier years are streamed through io_load.iter_country_product; pairs missing in some years are
+    averaged over the years where they are observed. At the start of the data the window is
+    truncated to the earlier years that exist.
+    """
+    products = pd.Index(df['product_hs92_code'].dropna().unique())
+    trailing = TrailingWindow(df['country_iso3_code'].unique(), products, columns, window, work_dir)
+    past_years = sorted(set(range(year - window + 1, year)).intersection(available_years(**load_kwargs)))
+    if len(past_years) < window - 1:
+        logging.info(f"Trailing window for {year} truncated to {len(past_years) + 1} of {window} years (earlier years not in the data).")
+    for past_year, past_df in iter_country_product(past_years, **load_kwargs):
+        trailing.push(past_year, past_df)
+    trailing.push(year, df)
+    return trailing.assign(df)
@@ -0,0 +1,174 @@
+import pandas as pd
+import numpy as np
+import os
+import argparse
+
+# (countries, products, years) per named scale; 'atlas' is roughly the full HS92 4-digit panel
+SCALES = {
+    'small': (30, 120, 3),
+    'medium': (120, 600, 5),
+    'atlas': (235, 1240, 29),
+}
+CLUSTER_NAMES = ['Agriculture', 'Minerals', 'Chemicals', 'Textiles', 'Stone', 'Metals', 'Machinery', 'Electronics', 'Vehicles', 'Other']
+TRADE_ERROR_CODE = 'XXXX'
+
+def _iso3_codes(rng: np.random.Generator, n: int) -> np.ndarray:
+    ids = np.sort(rng.choice(26**3, n, replace=False))
+    letters = np.array(list('ABCDEFGHIJKLMNOPQRSTUVWXYZ'))
+    return np.char.add(np.char.add(letters[ids // 676], letters[ids // 26 % 26]), letters[ids % 26])
+
+def _rca(export_value: np.ndarray) -> np.ndarray:
+    country_total = export_value.sum(axis=1, keepdims=True)
+    product_total = export_value.sum(axis=0, keepdims=True)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rca = (export_value / country_total) / (product_total / export_value.sum())
+    return np.nan_to_num(rca)
+
+def _distance(rca: np.ndarray) -> np.ndarray:
+    # 1 - density from min-conditional proximity, as in the Atlas
+    m = (rca >= 1).astype(np.float64)
+    co = m.T @ m
+    ubiquity = co.diagonal()
+    denominator = np.maximum(ubiquity[:, None], ubiquity[None, :])
+    phi = np.divide(co, denominator, out=np.zeros_like(co), where=denominator > 0)
+    total = phi.sum(axis=0)
+    density = np.divide(m @ phi, total[None, :], out=np.zeros_like(rca), where=total[None, :] > 0)
+    return np.clip(1 - density, 0, 1)
+
+def _product_tables(rng: np.random.Generator, n_products: int, k_edges: int) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    codes = np.sort(rng.choice(np.arange(101, 10000), n_products, replace=False))
+    code_str = np.char.zfill(codes.astype(str), 4)
+    # Clusters follow HS sections, so neighbouring codes sit together in the layout
+    cluster = np.minimum(codes * len(CLUSTER_NAMES) // 10000, len(CLUSTER_NAMES) - 1)
+    centers = rng.uniform(-10, 10, (len(CLUSTER_NAMES), 2))
+    xy = centers[cluster] + rng.normal(0, 1.5, (n_products, 2))
+
+    meta = pd.DataFrame({
+        'product_id': np.arange(n_products + 1),
+        'product_hs92_code': np.append(code_str, TRADE_ERROR_CODE),
+        'product_level': 4,
+        'product_name': np.append(np.char.add('Product ', code_str), 'Trade data discrepancies'),
+        'product_name_short': np.append(code_str, 'Discrepancies'),
+        'product_parent_id': pd.array(np.r_[cluster, -1], dtype='Int16'),
+        'product_id_hierarchy': np.append(np.char.add(np.char.add(cluster.astype(str), '.'), np.arange(n_products).astype(str)), ''),
+        'show_feasibility': np.r_[rng.random(n_products) < 0.95, False],
+        'natural_resource': np.r_[cluster <= 1, False] | np.r_[rng.random(n_products) < 0.05, False],
+        'green_product': np.r_[rng.random(n_products) < 0.1, False],
+    })
+    meta.loc[meta['product_parent_id'] < 0, 'product_parent_id'] = pd.NA
+    meta.loc[meta['product_id_hierarchy'] == '', 'product_id_hierarchy'] = np.nan
+
+    layout = pd.DataFrame({
+        'product_hs92_code': code_str,
+        'product_space_x': xy[:, 0],
+        'product_space_y': xy[:, 1],
+        'product_space_cluster_name': np.array(CLUSTER_NAMES)[cluster],
+    })
+
+    # Top edges link each product to its nearest neighbours in the layout
+    k = min(k_edges, n_products - 1)
+    distances = np.linalg.norm(xy[:, None, :] - xy[None, :, :], axis=2)
+    np.fill_diagonal(distances, np.inf)
+    nearest = np.argpartition(distances, k - 1, axis=1)[:, :k]
+    pairs = np.sort(np.c_[np.repeat(np.arange(n_products), k), nearest.ravel()], axis=1)
+    pairs = np.unique(pairs, axis=0)
+    edges = pd.DataFrame({'source': codes[pairs[:, 0]], 'target': codes[pairs[:, 1]]})
+    return meta, layout, edges
+
+def generate_atlas_data(data_dir: str, n_countries: int = 30, n_products: int = 120, years=range(2021, 2024),
+                        coverage: float = 0.9, error_share: float = 0.002, missing_share: float = 0.001,
+                        k_edges: int = 3, seed: int = 42) -> dict[str, str]:
+    """Writes seeded Atlas-shaped CSVs with the schemas io_load expects and returns their paths by file stem.
+
+    Exports follow a nested capability model (diverse countries export complex products), so RCA,
+    distance, ECI and PCI behave like the real data. `coverage` is the share of country-product
+    pairs present each year, `error_share` adds rows with the trade-error code 'XXXX', and
+    `missing_share` blanks cog/pci values to exercise the median fill.
+    """
+    rng = np.random.default_rng(seed)
+    years = list(years)
+    countries = _iso3_codes(rng, n_countries)
+    meta, layout, edges = _product_tables(rng, n_products, k_edges)
+    codes = meta['product_hs92_code'].to_numpy()[:n_products]
+
+    capability = rng.normal(0, 1, n_countries)
+    size = rng.normal(20, 1.5, n_countries)
+    complexity = rng.normal(0, 1, n_products)
+    market = rng.normal(0, 1, n_products)
+
+    product_frames, country_frames = [], []
+    for year in years:
+        capability = capability + rng.normal(0, 0.05, n_countries)
+        size = size + rng.normal(0.02, 0.05, n_countries)
+        exports_p = 1 / (1 + np.exp(-(1.5 * capability[:, None] - 1.5 * complexity[None, :] + 0.5)))
+        exported = rng.random((n_countries, n_products)) < exports_p
+        log_value = size[:, None] - 6 + market[None, :] + rng.normal(0, 1.5, (n_countries, n_products))
+        export_value = np.where(exported, np.rint(np.exp(log_value)), 0)
+        rca = _rca(export_value)
+        distance = _distance(rca)
+        pci = (complexity - complexity.mean()) / complexity.std() + rng.normal(0, 0.1, n_products)
+
+        rows, cols = np.nonzero(rng.random((n_countries, n_products)) < coverage)
+        frame = pd.DataFrame({
+            'country_id': rows,
+            'country_iso3_code': countries[rows],
+            'product_id': cols,
+            'product_hs92_code': codes[cols],
+            'year': year,
+            'export_value': export_value[rows, cols].astype(np.uint64),
+            'import_value': np.rint(np.exp(rng.normal(size[rows] - 7, 1.5))).astype(np.int64),
+            'global_market_share': np.divide(export_value[rows, cols], export_value.sum(axis=0)[cols],
+                                             out=np.zeros(len(rows)), where=export_value.sum(axis=0)[cols] > 0),
+            'export_rca': rca[rows, cols],
+            'distance': distance[rows, cols],
+            'cog': rng.normal(0, 1, len(rows)),
+            'pci': pci[cols],
+        })
+        n_errors = int(round(error_share * len(frame)))
+        if n_errors:
+            errors = frame.sample(n_errors, random_state=rng.integers(2**31)).assign(product_hs92_code=TRADE_ERROR_CODE, product_id=n_products)
+            frame = pd.concat([frame, errors.drop_duplicates('country_iso3_code')], ignore_index=True)
+        for column in ('cog', 'pci'):
+            frame.loc[rng.random(len(frame)) < missing_share, column] = np.nan
+        product_frames.append(frame)
+
+        eci = (capability - capability.mean()) / capability.std()
+        country_frames.append(pd.DataFrame({
+            'country_id': np.arange(n_countries),
+            'country_iso3_code': countries,
+            'year': year,
+            'export_value': export_value.sum(axis=1).astype(np.uint64),
+            'import_value': np.rint(np.exp(size - 1)).astype(np.int64),
+            'eci': eci,
+            'coi': rng.normal(0, 1, n_countries),
+            'diversity': (rca >= 1).sum(axis=1),
+            'growth_proj': rng.normal(0.03, 0.02, n_countries),
+        }))
+
+    os.makedirs(data_dir, exist_ok=True)
+    tables = {
+        'hs92_country_product_year_4': pd.concat(product_frames, ignore_index=True),
+        'product_hs92': meta,
+        'umap_layout_hs92': layout,
+        'top_edges_hs92': edges,
+        'hs92_country_year': pd.concat(country_frames, ignore_index=True),
+    }
+    paths = {}
+    for stem, table in tables.items():
+        paths[stem] = os.path.join(data_dir, f'{stem}.csv')
+        table.to_csv(paths[stem], index=False)
+    return paths
+
+def generate_scale(data_dir: str, scale: str = 'small', seed: int = 42, last_year: int = 2023) -> dict[str, str]:
+    """generate_atlas_data at one of the named SCALES, ending at `last_year`."""
+    n_countries, n_products, n_years = SCALES[scale]
+    return generate_atlas_data(data_dir, n_countries, n_products, range(last_year - n_years + 1, last_year + 1), seed=seed)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Write seeded synthetic Atlas HS92 CSVs.")
+    parser.add_argument('data_dir', help="Directory for the CSVs (e.g. ../data_synthetic).")
+    parser.add_argument('--scale', choices=SCALES, default='small')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    for path in generate_scale(args.data_dir, args.scale, args.seed).values():
+        print(path)
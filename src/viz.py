@@ -2,22 +2,46 @@ import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 import numpy as np
+import os
+import json
+import hashlib
+import plotly
+from concurrent.futures import ProcessPoolExecutor
+from plotly.offline import get_plotlyjs
 
-def plot_product_space(country_df: pd.DataFrame, nodes: pd.DataFrame, edges: pd.DataFrame, product_meta: pd.DataFrame) -> go.Figure:
-    """Plots the product space map for a given country."""
-    # Merge product_name into nodes
-    nodes_with_names = nodes.merge(
-        product_meta[["product_hs92_code", "product_name"]],
-        on="product_hs92_code",
-        how="left"
+def build_edge_trace(nodes: pd.DataFrame, edges: pd.DataFrame) -> go.Scatter:
+    """Builds the product space edge trace once; edges only depend on the layout, not the country."""
+    coords = (
+        nodes.dropna(subset=["product_hs92_code"])
+        .drop_duplicates("product_hs92_code")
+        .set_index("product_hs92_code")[["product_space_x", "product_space_y"]]
     )
+    coords.index = coords.index.astype("int64")
+    source = coords.index.get_indexer(edges["product_hs92_code_source"])
+    target = coords.index.get_indexer(edges["product_hs92_code_target"])
+    valid = (source >= 0) & (target >= 0)
+    xy = coords.to_numpy(dtype=np.float64)
+
+    # Segments are interleaved as (source, target, NaN) so plotly breaks the line between edges
+    edge_xy = np.full((3 * int(valid.sum()), 2), np.nan)
+    edge_xy[0::3] = xy[source[valid]]
+    edge_xy[1::3] = xy[target[valid]]
+    return go.Scatter(x=edge_xy[:, 0], y=edge_xy[:, 1], mode="lines", line=dict(width=0.5, color="#888"), hoverinfo="none")
 
+def plot_product_space(country_df: pd.DataFrame, nodes: pd.DataFrame, edges: pd.DataFrame, product_meta: pd.DataFrame, edge_trace: go.Scatter | None = None) -> go.Figure:
+    """Plots the product space map for a given country.
+
+    Pass nodes that already carry `product_name` and a prebuilt `edge_trace` to skip the
+    per-country merge and edge geometry when rendering many countries.
+    """
     # Merge product_name into nodes
-    nodes_with_names = nodes.merge(
-        product_meta[["product_hs92_code", "product_name"]],
-        on="product_hs92_code",
-        how="left"
-    )
+    nodes_with_names = nodes
+    if "product_name" not in nodes.columns:
+        nodes_with_names = nodes.merge(
+            product_meta[["product_hs92_code", "product_name"]],
+            on="product_hs92_code",
+            how="left"
+        )
 
     # Merge export_rca into nodes for sizing
     nodes_with_rca = nodes_with_names.merge(
@@ -33,33 +57,13 @@ def plot_product_space(country_df: pd.DataFrame, nodes: pd.DataFrame, edges: pd.
         y="product_space_y",
         hover_data=["product_hs92_code", "product_name", "export_rca"],
         color="product_space_cluster_name",
-        size=nodes_with_rca["export_rca"].apply(lambda x: np.log1p(x)),
+        size=np.log1p(nodes_with_rca["export_rca"]),
         title=f"Product Space - {country_df['country_iso3_code'].iloc[0]}"
     )
 
-    edge_x = []
-    edge_y = []
-
-    # Filter edges to only include products present in the nodes DataFrame
-    valid_product_codes = nodes["product_hs92_code"].unique()
-    filtered_edges = edges[
-        (edges["product_hs92_code_source"].isin(valid_product_codes)) &
-        (edges["product_hs92_code_target"].isin(valid_product_codes))
-    ]
-
-    for _, edge in filtered_edges.iterrows():
-        source_node = nodes[nodes["product_hs92_code"] == edge["product_hs92_code_source"]]
-        target_node = nodes[nodes["product_hs92_code"] == edge["product_hs92_code_target"]]
-
-        if not source_node.empty and not target_node.empty:
-            x0 = source_node["product_space_x"].values[0]
-            y0 = source_node["product_space_y"].values[0]
-            x1 = target_node["product_space_x"].values[0]
-            y1 = target_node["product_space_y"].values[0]
-            edge_x.extend([x0, x1, None])
-            edge_y.extend([y0, y1, None])
-
-    fig.add_trace(go.Scatter(x=edge_x, y=edge_y, mode="lines", line=dict(width=0.5, color="#888"), hoverinfo="none"))
+    if edge_trace is None:
+        edge_trace = build_edge_trace(nodes, edges)
+    fig.add_trace(edge_trace)
     return fig
 
 def plot_opportunities_scatter(country_df: pd.DataFrame, use: str = "density", presence: str = "rca") -> go.Figure:
@@ -75,3 +79,101 @@ def plot_opportunities_scatter(country_df: pd.DataFrame, use: str = "density", p
         title=f"Growth Opportunities - {country_df['country_iso3_code'].iloc[0]}"
     )
     return fig
+
+
+# Columns of the country frame the two figures read
+RENDER_COLUMNS = ["country_iso3_code", "product_hs92_code", "product_name", "export_rca", "density"]
+PLOTLYJS_FILENAME = "plotly.min.js"
+RENDER_MANIFEST = "render_manifest.json"
+RENDER_OUTPUTS = ["product_space.html", "opportunities_scatter.html"]
+
+_shared = {}
+
+def _init_render_worker(nodes: pd.DataFrame, edges: pd.DataFrame, product_meta: pd.DataFrame) -> None:
+    _shared.update(nodes=nodes, edges=edges, product_meta=product_meta, edge_trace=build_edge_trace(nodes, edges))
+
+def layout_fingerprint(nodes: pd.DataFrame, edges: pd.DataFrame, **params) -> str:
+    """Hashes the node/edge layout and viz parameters shared by every country's figures."""
+    digest = hashlib.sha1()
+    digest.update(pd.util.hash_pandas_object(nodes, index=False).to_numpy().tobytes())
+    digest.update(pd.util.hash_pandas_object(edges, index=False).to_numpy().tobytes())
+    digest.update(json.dumps({"plotly": plotly.__version__, **params}, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+def country_fingerprint(country_df: pd.DataFrame, layout_key: str) -> str:
+    """Hashes a country's slice (restricted to the columns its figures read) with the layout fingerprint."""
+    digest = hashlib.sha1(layout_key.encode())
+    digest.update(pd.util.hash_pandas_object(country_df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+def _load_manifest(path: str) -> dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def _write_manifest(path: str, manifest: dict) -> None:
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def _render_country(country_iso: str, country_df: pd.DataFrame, output_root: str, include_plotlyjs, presence: str = "rca") -> str:
+    output_dir = os.path.join(output_root, country_iso)
+    os.makedirs(output_dir, exist_ok=True)
+
+    # Product Space Map
+    fig_ps = plot_product_space(country_df, _shared["nodes"], _shared["edges"], _shared["product_meta"], edge_trace=_shared["edge_trace"])
+    fig_ps.write_html(os.path.join(output_dir, "product_space.html"), include_plotlyjs=include_plotlyjs)
+
+    # Growth Opportunities Scatter
+    fig_opp = plot_opportunities_scatter(country_df, presence=presence)
+    fig_opp.write_html(os.path.join(output_dir, "opportunities_scatter.html"), include_plotlyjs=include_plotlyjs)
+    return country_iso
+
+def render_country_figures(df: pd.DataFrame, nodes: pd.DataFrame, edges: pd.DataFrame, product_meta: pd.DataFrame,
+                           output_root: str = "outputs", workers: int = 1, shared_plotlyjs: bool = True, incremental: bool = True,
+                           presence: str = "rca") -> list[str]:
+    """Writes the product space map and opportunities scatter for every country and returns the countries rendered.
+
+    Countries are split with one groupby and fanned out over `workers` processes (0 = all cores);
+    layout tables are sent once per worker. With `shared_plotlyjs`, plotly.js is written once to
+    `output_root` and each HTML file references it instead of inlining the bundle. With
+    `incremental`, countries whose fingerprint matches `render_manifest.json` are skipped.
+    `presence` picks the scatter's y axis ("rca" or "peer_relative" for `rel_presence`).
+    """
+    include_plotlyjs = True
+    os.makedirs(output_root, exist_ok=True)
+    if shared_plotlyjs:
+        with open(os.path.join(output_root, PLOTLYJS_FILENAME), "w", encoding="utf-8") as f:
+            f.write(get_plotlyjs())
+        include_plotlyjs = f"../{PLOTLYJS_FILENAME}"
+
+    if "product_name" not in nodes.columns:
+        nodes = nodes.merge(product_meta[["product_hs92_code", "product_name"]], on="product_hs92_code", how="left")
+    columns = RENDER_COLUMNS + ([] if presence == "rca" else ["rel_presence"])
+    countries = df[columns].groupby("country_iso3_code", sort=False, observed=True)
+    workers = workers or os.cpu_count()
+
+    manifest_path = os.path.join(output_root, RENDER_MANIFEST)
+    manifest = _load_manifest(manifest_path) if incremental else {}
+    layout_key = layout_fingerprint(nodes, edges, include_plotlyjs=include_plotlyjs, presence=presence)
+    pending, fingerprints = [], {}
+    for country_iso, country_df in countries:
+        fingerprints[country_iso] = country_fingerprint(country_df, layout_key)
+        outputs_exist = all(os.path.exists(os.path.join(output_root, country_iso, name)) for name in RENDER_OUTPUTS)
+        if manifest.get(country_iso) != fingerprints[country_iso] or not outputs_exist:
+            pending.append((country_iso, country_df))
+
+    if not pending:
+        rendered = []
+    elif workers <= 1 or len(pending) == 1:
+        _init_render_worker(nodes, edges, product_meta)
+        rendered = [_render_country(country_iso, country_df, output_root, include_plotlyjs, presence) for country_iso, country_df in pending]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(pending)), initializer=_init_render_worker, initargs=(nodes, edges, product_meta)) as executor:
+            futures = [executor.submit(_render_country, country_iso, country_df, output_root, include_plotlyjs, presence) for country_iso, country_df in pending]
+            rendered = [future.result() for future in futures]
+
+    _write_manifest(manifest_path, {**manifest, **fingerprints})
+    return rendered
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# src modules import each other as top-level modules (e.g. `from fit import ...`)
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
@@ -0,0 +1,29 @@
+import pandas as pd
+import numpy as np
+import pytest
+
+from artifacts import OUTPUT_FORMATS, write_table, read_table
+
+@pytest.fixture
+def similarity() -> pd.DataFrame:
+    countries = pd.Index(['AAA', 'BBB', 'CCC'], name='country_iso3_code')
+    return pd.DataFrame(np.eye(3), index=countries, columns=list(countries))
+
+@pytest.mark.parametrize('fmt', OUTPUT_FORMATS)
+def test_round_trip_with_index(tmp_path, similarity, fmt):
+    path = write_table(similarity, str(tmp_path / 'similarity'), fmt, index=True)
+    result = read_table(path, index_col='country_iso3_code')
+    pd.testing.assert_frame_equal(result, similarity, check_dtype=False)
+
+@pytest.mark.parametrize('fmt', OUTPUT_FORMATS)
+def test_round_trip_without_index_col(tmp_path, similarity, fmt):
+    path = write_table(similarity, str(tmp_path / 'similarity'), fmt, index=True)
+    result = read_table(path)
+    assert list(result.columns) == ['country_iso3_code', 'AAA', 'BBB', 'CCC']
+    assert isinstance(result.index, pd.RangeIndex)
+
+@pytest.mark.parametrize('fmt', OUTPUT_FORMATS)
+def test_index_col_from_column(tmp_path, similarity, fmt):
+    path = write_table(similarity.reset_index(), str(tmp_path / 'summary'), fmt)
+    result = read_table(path, index_col='country_iso3_code')
+    pd.testing.assert_frame_equal(result, similarity, check_dtype=False)
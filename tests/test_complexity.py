@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from complexity import complexity_indices, complexity_outlook
+from fit import proximity_matrix
+
+def _standardize(values: np.ndarray) -> np.ndarray:
+    return (values - values.mean()) / values.std()
+
+def _second_eigenvector(matrix: np.ndarray) -> np.ndarray:
+    values, vectors = np.linalg.eig(matrix)
+    return np.real(vectors[:, np.argsort(-np.real(values))[1]])
+
+def _aligned(reference: np.ndarray, result: np.ndarray) -> np.ndarray:
+    # Eigenvectors are defined up to sign
+    return reference if np.dot(reference, result) >= 0 else -reference
+
+@pytest.fixture
+def binary() -> np.ndarray:
+    rng = np.random.default_rng(1)
+    # Nested structure: diverse countries also export the ubiquitous products
+    capability = np.sort(rng.random(9))
+    complexity = rng.random(14)
+    binary = (capability[:, None] + 0.3 * rng.random((9, 14)) > complexity[None, :]).astype(np.uint8)
+    binary[0] = 0     # country without exports
+    binary[:, 5] = 0  # product nobody exports
+    return binary
+
+def test_complexity_indices_match_dense_eigendecomposition(binary):
+    eci, pci = complexity_indices(binary)
+    rows, cols = binary.sum(axis=1) > 0, binary.sum(axis=0) > 0
+    m = binary[rows][:, cols].astype(np.float64)
+    diversity, ubiquity = m.sum(axis=1), m.sum(axis=0)
+
+    m_cc = (m / diversity[:, None]) @ (m / ubiquity[None, :]).T
+    m_pp = (m / ubiquity[None, :]).T @ (m / diversity[:, None])
+    expected_eci = _standardize(_second_eigenvector(m_cc))
+    expected_pci = _standardize(_second_eigenvector(m_pp))
+
+    assert np.isnan(eci[~rows]).all() and np.isnan(pci[~cols]).all()
+    np.testing.assert_allclose(eci[rows], _aligned(expected_eci, eci[rows]), atol=1e-8)
+    np.testing.assert_allclose(pci[cols], _aligned(expected_pci, pci[cols]), atol=1e-8)
+    assert np.corrcoef(eci[rows], diversity)[0, 1] > 0
+
+def test_complexity_outlook_matches_definition(binary):
+    _, pci = complexity_indices(binary)
+    phi = proximity_matrix(binary).astype(np.float64)
+    cog, coi = complexity_outlook(binary, pci, proximity_matrix(binary))
+
+    n_countries, n_products = binary.shape
+    weights = np.nan_to_num(pci)
+    expected_cog = np.zeros((n_countries, n_products))
+    expected_coi = np.zeros(n_countries)
+    for c in range(n_countries):
+        for p in range(n_products):
+            for q in range(n_products):
+                if phi[:, q].sum() > 0:
+                    expected_cog[c, p] += phi[p, q] / phi[:, q].sum() * (1 - binary[c, q]) * weights[q]
+            if phi[p].sum() > 0:
+                density = (phi[p] * binary[c]).sum() / phi[p].sum()
+                expected_coi[c] += density * (1 - binary[c, p]) * weights[p]
+
+    np.testing.assert_allclose(cog, expected_cog, rtol=1e-5, atol=1e-5)
+    np.testing.assert_allclose(coi, expected_coi, rtol=1e-5, atol=1e-5)
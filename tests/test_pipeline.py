@@ -0,0 +1,20 @@
+import pytest
+import yaml
+
+from pipeline import parse_years
+
+@pytest.mark.parametrize('years, expected', [
+    (2021, [2021]),
+    ('2021..2023', [2021, 2022, 2023]),
+    ([2023, 2021, 2023], [2021, 2023]),
+    (['2021', '2022'], [2021, 2022]),
+    (yaml.safe_load('years: [2019..2021]')['years'], [2019, 2020, 2021]),
+    ([2015, '2019..2020'], [2015, 2019, 2020]),
+])
+def test_parse_years(years, expected):
+    assert parse_years(years) == expected
+
+@pytest.mark.parametrize('years', ['2023..2021', ['2023..2021'], ['1995..x']])
+def test_parse_years_rejects_bad_ranges(years):
+    with pytest.raises(ValueError):
+        parse_years(years)
@@ -0,0 +1,38 @@
+import pandas as pd
+import numpy as np
+import pytest
+
+from ranking import top_k_per_group
+
+def _nlargest(group: pd.DataFrame, k: int) -> pd.DataFrame:
+    # nlargest sorts unstably (and keeps missing scores) once k reaches the group size
+    if k >= len(group):
+        return group.sort_values('score', ascending=False, kind='stable')
+    return group.nlargest(k, 'score')
+
+def _reference(df: pd.DataFrame, k: int) -> pd.DataFrame:
+    df = df.dropna(subset=['score'])
+    return (df.groupby('country_iso3_code', observed=True, group_keys=False)[df.columns.tolist()]
+              .apply(lambda group: _nlargest(group, k)).reset_index(drop=True))
+
+@pytest.fixture
+def df() -> pd.DataFrame:
+    rng = np.random.default_rng(3)
+    n = 400
+    frame = pd.DataFrame({
+        'country_iso3_code': rng.choice(['DEU', 'BRA', 'AAA', 'ZAF'], n),
+        'product_hs92_code': np.arange(n),
+        'score': np.round(rng.normal(size=n), 1),  # rounding creates ties
+    })
+    frame.loc[rng.random(n) < 0.05, 'score'] = np.nan
+    return frame
+
+@pytest.mark.parametrize('k', [1, 3, 40, 200])
+@pytest.mark.parametrize('categorical', [False, True])
+def test_top_k_per_group_matches_nlargest(df, k, categorical):
+    if categorical:
+        # Unused and unsorted categories must not change the result
+        df['country_iso3_code'] = pd.Categorical(df['country_iso3_code'], categories=['ZAF', 'USA', 'AAA', 'DEU', 'BRA'])
+    result = top_k_per_group(df, 'country_iso3_code', 'score', k=k)
+    expected = _reference(df, k)
+    pd.testing.assert_frame_equal(result, expected)
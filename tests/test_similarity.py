@@ -0,0 +1,42 @@
+import pandas as pd
+import numpy as np
+import pytest
+from sklearn.metrics import jaccard_score
+
+from similarity import jaccard_matrix, country_similarity_jaccard
+
+def _jaccard_loop(binary: np.ndarray) -> np.ndarray:
+    # Reference: the original pairwise jaccard_score loop
+    n = binary.shape[0]
+    expected = np.zeros((n, n))
+    for i in range(n):
+        for j in range(n):
+            expected[i, j] = jaccard_score(binary[i], binary[j], zero_division=0)
+    return expected
+
+@pytest.fixture
+def binary() -> np.ndarray:
+    rng = np.random.default_rng(0)
+    binary = (rng.random((12, 70)) < 0.3).astype(np.int8)
+    binary[3] = 0  # empty row: its unions with itself are empty
+    return binary
+
+@pytest.mark.parametrize('packed', [False, True])
+@pytest.mark.parametrize('order', ['C', 'F'])
+def test_jaccard_matrix_matches_jaccard_score(binary, packed, order):
+    result = jaccard_matrix(np.asarray(binary, order=order), packed=packed)
+    np.testing.assert_allclose(result, _jaccard_loop(binary))
+
+@pytest.mark.parametrize('packed', [False, True])
+def test_country_similarity_jaccard_from_frame(binary, packed):
+    countries = [f'C{i:02d}' for i in range(binary.shape[0])]
+    products = [f'{p:04d}' for p in range(binary.shape[1])]
+    rows, cols = np.indices(binary.shape)
+    df = pd.DataFrame({
+        'country_iso3_code': np.array(countries)[rows.ravel()],
+        'product_hs92_code': np.array(products)[cols.ravel()],
+        'x_binary': binary.ravel(),
+    })
+    result = country_similarity_jaccard(df, packed=packed)
+    assert list(result.index) == countries
+    np.testing.assert_allclose(result.to_numpy(), _jaccard_loop(binary))
@@ -0,0 +1,26 @@
+import pandas as pd
+import numpy as np
+
+from smoothing import TrailingWindow
+
+def _year_frame(export_value) -> pd.DataFrame:
+    return pd.DataFrame({
+        'country_iso3_code': ['AAA', 'BBB'],
+        'product_hs92_code': ['0101', '0101'],
+        'export_value': np.array(export_value, dtype=np.uint64),
+    })
+
+def test_trailing_window_keeps_large_export_values():
+    df = _year_frame([123456789012, 98765432101])
+    trailing = TrailingWindow(df['country_iso3_code'], pd.Index(['0101']), ['export_value'], window=1)
+    trailing.push(2023, df)
+    result = trailing.assign(df.copy())
+    assert result['export_value'].tolist() == [123456789012, 98765432101]
+
+def test_trailing_window_averages_observed_years():
+    past, current = _year_frame([100, 10]), _year_frame([300, 20])
+    past = past.iloc[:1]  # BBB not observed in the earlier year
+    trailing = TrailingWindow(current['country_iso3_code'], pd.Index(['0101']), ['export_value'], window=3)
+    trailing.push(2022, past)
+    trailing.push(2023, current)
+    assert trailing.assign(current.copy())['export_value'].tolist() == [200, 20]